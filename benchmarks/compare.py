@@ -0,0 +1,61 @@
+"""Compares two result files written by benchmarks.load or benchmarks.micro.
+
+    python -m benchmarks.compare benchmarks/results/base.json benchmarks/results/new.json
+
+Latency changes are shown so that negative is better; throughput changes so
+that positive is better.
+"""
+
+import argparse
+import json
+
+_SECTIONS = ("endpoints", "benchmarks")
+_METRICS = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "false_positive_rate")
+
+
+def _change(base: float, new: float) -> str:
+    if not base:
+        return "n/a"
+    return f"{(new - base) / base * 100:+.1f}%"
+
+
+def compare(base: dict, new: dict) -> None:
+    if base["meta"]["settings"] != new["meta"]["settings"]:
+        print("Warning: the runs used different settings:")
+        for name, value in base["meta"]["settings"].items():
+            if new["meta"]["settings"].get(name) != value:
+                print(f"  {name}: {value} -> {new['meta']['settings'].get(name)}")
+
+    print(f"{'name':<34}{'metric':<16}{'base':>12}{'new':>12}{'change':>10}")
+    for section in _SECTIONS:
+        rows = base.get(section, {})
+        for name, base_row in rows.items():
+            new_row = new.get(section, {}).get(name)
+            if new_row is None:
+                continue
+            for metric in _METRICS:
+                if metric not in base_row:
+                    continue
+                print(
+                    f"{name:<34}{metric:<16}{base_row[metric]:>12.3f}"
+                    f"{new_row[metric]:>12.3f}"
+                    f"{_change(base_row[metric], new_row[metric]):>10}"
+                )
+            if base_row.get("errors") or new_row.get("errors"):
+                print(
+                    f"{name:<34}{'errors':<16}"
+                    f"{base_row['errors']:>12}{new_row['errors']:>12}"
+                )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("new")
+    args = parser.parse_args()
+    with open(args.base) as base, open(args.new) as new:
+        compare(json.load(base), json.load(new))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""User queries through the asyncpg pool, against the `databases` path they replaced.
+
+    python -m benchmarks.db --concurrency 16 --iterations 20000
+    python -m benchmarks.db --output benchmarks/results/db.json
+
+Needs the Postgres configured in the environment, with the migrations
+applied. Seeds `--users` accounts, then looks users up by email and by id
+from `--concurrency` concurrent tasks, bypassing the user cache:
+
+- `asyncpg`: `database.fetchrow_read` with the `$n` queries of
+  src/db/models/user.py, mapped with `_to_user` (no validation).
+- `databases`: the previous implementation, `Database.fetch_one` with
+  `:name` parameters, each row validated by `UserSchema`. It needs the
+  `databases` package, which the app no longer depends on:
+  `uv pip install 'databases[asyncpg]'`. Without it only `asyncpg` runs.
+
+Both use a pool of `DB_POOL_MAX_SIZE` connections. The seeded accounts
+are deleted afterwards.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.report import print_table, run_metadata, summarize, write_results
+from src.db.config import database
+from src.db.models.user import (
+    GET_USER_BY_EMAIL_QUERY,
+    GET_USER_BY_ID_QUERY,
+    UserSchema,
+    _to_user,
+)
+from src.settings import settings
+
+EMAIL_PREFIX = "db-benchmark-"
+
+# The queries as src/db/models/user.py sent them through `databases`.
+DATABASES_BY_EMAIL_QUERY = """
+    SELECT id, email, password_hash, is_verified, created_at, updated_at
+    FROM users
+    WHERE email = :email
+"""
+DATABASES_BY_ID_QUERY = """
+    SELECT id, email, created_at, updated_at
+    FROM users
+    WHERE id = :user_id
+"""
+
+
+async def _seed(count: int) -> list[tuple[int, str]]:
+    async with database.primary.acquire() as connection:
+        records = await connection.fetch(
+            """
+            INSERT INTO users (email, password_hash)
+            SELECT $1 || n || '@example.com', 'not-a-hash'
+            FROM generate_series(1, $2) AS n
+            ON CONFLICT (email) DO UPDATE SET email = EXCLUDED.email
+            RETURNING id, email
+            """,
+            EMAIL_PREFIX,
+            count,
+        )
+    return [(record["id"], record["email"]) for record in records]
+
+
+async def _delete_seeded() -> None:
+    async with database.primary.acquire() as connection:
+        await connection.execute(
+            "DELETE FROM users WHERE email LIKE $1", EMAIL_PREFIX + "%"
+        )
+
+
+async def _measure(lookup, keys: list, iterations: int, concurrency: int) -> dict:
+    latencies = []
+    remaining = iter(range(iterations))
+
+    async def client() -> None:
+        for index in remaining:
+            call_started_at = time.perf_counter()
+            if await lookup(keys[index % len(keys)]) is None:
+                raise RuntimeError("seeded user not found")
+            latencies.append(time.perf_counter() - call_started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started_at)
+
+
+async def _asyncpg_email(email: str) -> UserSchema | None:
+    record = await database.fetchrow_read(GET_USER_BY_EMAIL_QUERY, email)
+    return _to_user(record) if record else None
+
+
+async def _asyncpg_id(user_id: int) -> UserSchema | None:
+    record = await database.fetchrow_read(GET_USER_BY_ID_QUERY, user_id)
+    return _to_user(record) if record else None
+
+
+async def _run_databases(
+    emails: list[str], ids: list[int], args: argparse.Namespace
+) -> dict:
+    from databases import Database
+
+    old_database = Database(
+        str(settings.database_url),
+        min_size=settings.db_pool_min_size,
+        max_size=settings.db_pool_max_size,
+    )
+
+    async def by_email(email: str) -> UserSchema | None:
+        row = await old_database.fetch_one(
+            query=DATABASES_BY_EMAIL_QUERY, values={"email": email}
+        )
+        return UserSchema(**row._mapping) if row else None
+
+    async def by_id(user_id: int) -> UserSchema | None:
+        row = await old_database.fetch_one(
+            query=DATABASES_BY_ID_QUERY, values={"user_id": user_id}
+        )
+        return UserSchema(**row._mapping) if row else None
+
+    await old_database.connect()
+    try:
+        # Open every connection before timing anything.
+        await _measure(by_id, ids, args.concurrency * 10, args.concurrency)
+        return {
+            "databases-by-email": await _measure(
+                by_email, emails, args.iterations, args.concurrency
+            ),
+            "databases-by-id": await _measure(
+                by_id, ids, args.iterations, args.concurrency
+            ),
+        }
+    finally:
+        await old_database.disconnect()
+
+
+async def run(args: argparse.Namespace) -> dict:
+    await database.connect()
+    try:
+        users = await _seed(args.users)
+        random.Random(args.seed).shuffle(users)
+        ids = [user_id for user_id, _ in users]
+        emails = [email for _, email in users]
+        await _measure(_asyncpg_id, ids, args.concurrency * 10, args.concurrency)
+        results = {
+            "asyncpg-by-email": await _measure(
+                _asyncpg_email, emails, args.iterations, args.concurrency
+            ),
+            "asyncpg-by-id": await _measure(
+                _asyncpg_id, ids, args.iterations, args.concurrency
+            ),
+        }
+        try:
+            results.update(await _run_databases(emails, ids, args))
+        except ImportError:
+            print("databases is not installed; only the asyncpg path was measured")
+        await _delete_seeded()
+    finally:
+        await database.disconnect()
+
+    return {
+        "meta": run_metadata(
+            benchmark="db",
+            iterations=args.iterations,
+            concurrency=args.concurrency,
+            users=args.users,
+        ),
+        "benchmarks": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=10_000, help="seeded accounts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_table(f"user lookups, {args.concurrency} concurrent", results["benchmarks"])
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
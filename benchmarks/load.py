@@ -0,0 +1,367 @@
+"""Drives a mixed workload against the auth service and reports per-endpoint latency.
+
+    python -m benchmarks.load --concurrency 32 --duration 30
+    python -m benchmarks.load --rate 200 --output benchmarks/results/base.json
+    python -m benchmarks.load --backend local --url http://localhost:8000 --rate 500
+
+By default the app from `src.application.get_app` runs in this process on top
+of the stand-ins in `benchmarks/stubs.py`; `--backend local` uses the Postgres
+and Redis configured in the environment instead. `--url` sends the requests to
+an already running server (e.g. gunicorn) and only uses the local backend to
+seed accounts, so it requires `--backend local`.
+
+Closed loop (`--concurrency`): each virtual client sends its next request as
+soon as the previous one completes. Open loop (`--rate`): requests arrive on a
+fixed schedule however slowly the service answers, and latency is measured
+from the scheduled start so that queueing delay is not hidden.
+"""
+
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from collections import Counter, defaultdict
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from uuid import uuid4
+
+import httpx
+
+from benchmarks.report import print_table, run_metadata, summarize, write_results
+from benchmarks.stubs import install_stubs, smtp_sink
+from src.db.config import database, redis, redis_pool
+from src.db.models.user import create_user, update_user_by_id
+from src.settings import settings
+from src.utils.hashing import _hash
+
+PASSWORD = "Bench-Password-1!"
+DEFAULT_MIX = "login=1,refresh=2,get-user-details=6,register=1"
+
+
+@dataclass
+class Session:
+    user_id: int
+    email: str
+    access_token: str = ""
+    refresh_token: str = ""
+
+
+class Workload:
+    """Seeded accounts plus the per-endpoint measurements of one run."""
+
+    def __init__(
+        self, mix: dict[str, int], batch_size: int, internal_api_key: str, seed: int
+    ):
+        self.names = list(mix)
+        self.weights = list(mix.values())
+        self.batch_size = batch_size
+        self.internal_headers = {"X-Internal-Api-Key": internal_api_key}
+        self.random = random.Random(seed)
+        self.run_id = uuid4().hex[:8]
+        self._new_accounts = itertools.count()
+        self.sessions: list[Session] = []
+        # Refresh tokens are single use, so a session is refreshed by one
+        # request at a time.
+        self.idle_sessions: asyncio.Queue[Session] = asyncio.Queue()
+        self.measure_from = float("inf")
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.status_codes: dict[str, Counter] = defaultdict(Counter)
+        self.dropped = 0
+
+    async def seed(self, client: httpx.AsyncClient, accounts: int) -> None:
+        """Create verified accounts directly in the database, then log each in."""
+        password_hash, _ = _hash(PASSWORD)
+        for index in range(accounts):
+            user = await create_user(
+                f"bench-{self.run_id}-{index}@example.com", password_hash
+            )
+            await update_user_by_id(user.id, {"is_verified": True})
+            self.sessions.append(Session(user.id, user.email))
+
+        # Stay within the hashing queue so seeding is never shed with a 503.
+        limit = asyncio.Semaphore(settings.hashing_pool_size)
+
+        async def log_in(session: Session) -> None:
+            async with limit:
+                response = await client.post(
+                    "/api/accounts/login",
+                    json={"email": session.email, "password": PASSWORD},
+                )
+            response.raise_for_status()
+            session.access_token = response.json()["access_token"]
+            session.refresh_token = response.json()["refresh_token"]
+            self.idle_sessions.put_nowait(session)
+
+        await asyncio.gather(*(log_in(session) for session in self.sessions))
+
+    def pick(self) -> str:
+        return self.random.choices(self.names, self.weights)[0]
+
+    async def execute(
+        self, client: httpx.AsyncClient, name: str, started_at: float
+    ) -> None:
+        try:
+            response = await OPERATIONS[name](self, client)
+            status_code = str(response.status_code)
+        except httpx.HTTPError as e:
+            status_code = type(e).__name__
+        if started_at >= self.measure_from:
+            self.latencies[name].append(time.perf_counter() - started_at)
+            self.status_codes[name][status_code] += 1
+
+    def results(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name in self.names:
+            codes = self.status_codes[name]
+            errors = sum(
+                count for code, count in codes.items() if not code.startswith("2")
+            )
+            endpoints[name] = {
+                **summarize(self.latencies[name], elapsed, errors),
+                "status_codes": dict(codes),
+            }
+        total = summarize(
+            list(itertools.chain.from_iterable(self.latencies.values())),
+            elapsed,
+            sum(endpoint["errors"] for endpoint in endpoints.values()),
+        )
+        return {"endpoints": endpoints, "total": total}
+
+
+async def register(workload: Workload, client: httpx.AsyncClient) -> httpx.Response:
+    email = f"bench-{workload.run_id}-new-{next(workload._new_accounts)}@example.com"
+    return await client.post(
+        "/api/accounts/register", json={"email": email, "password": PASSWORD}
+    )
+
+
+async def login(workload: Workload, client: httpx.AsyncClient) -> httpx.Response:
+    session = workload.random.choice(workload.sessions)
+    return await client.post(
+        "/api/accounts/login", json={"email": session.email, "password": PASSWORD}
+    )
+
+
+async def refresh(workload: Workload, client: httpx.AsyncClient) -> httpx.Response:
+    session = await workload.idle_sessions.get()
+    try:
+        response = await client.post(
+            "/api/accounts/refresh", json={"refresh_token": session.refresh_token}
+        )
+        if response.status_code == 200:
+            session.access_token = response.json()["access_token"]
+            session.refresh_token = response.json()["refresh_token"]
+        return response
+    finally:
+        workload.idle_sessions.put_nowait(session)
+
+
+async def get_user_details(
+    workload: Workload, client: httpx.AsyncClient
+) -> httpx.Response:
+    session = workload.random.choice(workload.sessions)
+    return await client.get(
+        "/api/accounts/get-user-details",
+        headers={"Authorization": f"Bearer {session.access_token}"},
+    )
+
+
+async def introspect(workload: Workload, client: httpx.AsyncClient) -> httpx.Response:
+    sessions = workload.random.choices(workload.sessions, k=workload.batch_size)
+    return await client.post(
+        "/api/accounts/introspect",
+        json={"tokens": [session.access_token for session in sessions]},
+        headers=workload.internal_headers,
+    )
+
+
+async def users_batch(workload: Workload, client: httpx.AsyncClient) -> httpx.Response:
+    sessions = workload.random.choices(workload.sessions, k=workload.batch_size)
+    return await client.post(
+        "/api/accounts/users/batch",
+        json={"ids": [session.user_id for session in sessions]},
+        headers=workload.internal_headers,
+    )
+
+
+OPERATIONS = {
+    "register": register,
+    "login": login,
+    "refresh": refresh,
+    "get-user-details": get_user_details,
+    "introspect": introspect,
+    "users-batch": users_batch,
+}
+
+
+async def closed_loop(
+    workload: Workload, client: httpx.AsyncClient, concurrency: int, deadline: float
+) -> None:
+    async def virtual_client() -> None:
+        while (started_at := time.perf_counter()) < deadline:
+            await workload.execute(client, workload.pick(), started_at)
+
+    await asyncio.gather(*(virtual_client() for _ in range(concurrency)))
+
+
+async def open_loop(
+    workload: Workload,
+    client: httpx.AsyncClient,
+    rate: float,
+    deadline: float,
+    max_in_flight: int,
+    poisson: bool,
+) -> None:
+    in_flight: set[asyncio.Task] = set()
+    scheduled_at = time.perf_counter()
+    while scheduled_at < deadline:
+        delay = scheduled_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(in_flight) >= max_in_flight:
+            workload.dropped += scheduled_at >= workload.measure_from
+        else:
+            task = asyncio.create_task(
+                workload.execute(client, workload.pick(), scheduled_at)
+            )
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        scheduled_at += workload.random.expovariate(rate) if poisson else 1 / rate
+    await asyncio.gather(*in_flight)
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(
+                f"Unknown operation {name!r}; choose from {', '.join(OPERATIONS)}"
+            )
+        mix[name] = int(weight or 1)
+    return mix
+
+
+async def run(args: argparse.Namespace) -> dict:
+    if args.backend == "stub":
+        install_stubs(db_latency=args.db_latency / 1000)
+    # Every simulated client shares one IP, which the login limits would reject.
+    settings.rate_limit_enabled = args.rate_limits
+    internal_api_key = args.internal_api_key or settings.internal_api_key
+    if internal_api_key is None and args.url is None:
+        internal_api_key = settings.internal_api_key = "benchmark"
+
+    async with AsyncExitStack() as stack:
+        if args.url:
+            await database.connect()
+            stack.push_async_callback(redis_pool.aclose)
+            stack.push_async_callback(redis.aclose)
+            stack.push_async_callback(database.disconnect)
+            client = httpx.AsyncClient(
+                base_url=args.url,
+                timeout=args.timeout,
+                limits=httpx.Limits(max_connections=args.max_in_flight),
+            )
+        else:
+            from src.application import get_app
+
+            app = get_app()
+            await stack.enter_async_context(app.router.lifespan_context(app))
+            client = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=app),
+                base_url="http://benchmark",
+                timeout=args.timeout,
+            )
+        await stack.enter_async_context(client)
+
+        sink = None
+        if args.email_worker:
+            from src.externals.outbox import EmailOutboxWorker
+
+            sink = await stack.enter_async_context(smtp_sink())
+            settings.email_transport = "smtp"
+            worker = EmailOutboxWorker()
+            worker_task = asyncio.create_task(worker.run())
+
+            async def stop_worker() -> None:
+                worker.stop()
+                await worker_task
+
+            stack.push_async_callback(stop_worker)
+
+        workload = Workload(
+            parse_mix(args.mix), args.batch_size, internal_api_key or "", args.seed
+        )
+        await workload.seed(client, args.users)
+
+        workload.measure_from = time.perf_counter() + args.warmup
+        deadline = workload.measure_from + args.duration
+        if args.rate:
+            await open_loop(
+                workload, client, args.rate, deadline, args.max_in_flight, args.poisson
+            )
+        else:
+            await closed_loop(workload, client, args.concurrency, deadline)
+
+    return {
+        "meta": run_metadata(
+            benchmark="load",
+            backend=args.backend,
+            target=args.url or "in-process",
+            mode="open" if args.rate else "closed",
+            rate=args.rate,
+            poisson=args.poisson,
+            concurrency=None if args.rate else args.concurrency,
+            duration=args.duration,
+            warmup=args.warmup,
+            users=args.users,
+            mix=args.mix,
+            rate_limits=args.rate_limits,
+            db_latency_ms=args.db_latency if args.backend == "stub" else None,
+            dropped=workload.dropped,
+            emails_delivered=sink.messages if sink else None,
+        ),
+        **workload.results(args.duration),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("stub", "local"), default="stub")
+    parser.add_argument("--url", help="benchmark a running server instead")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, default=16, help="closed loop")
+    load.add_argument("--rate", type=float, help="open loop, requests per second")
+    parser.add_argument("--poisson", action="store_true", help="random arrivals")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=5.0)
+    parser.add_argument("--users", type=int, default=100, help="seeded accounts")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="operation=weight,...")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--db-latency", type=float, default=0.0, help="stub, ms")
+    parser.add_argument("--email-worker", action="store_true")
+    parser.add_argument(
+        "--rate-limits", action="store_true", help="keep login/register limits on"
+    )
+    parser.add_argument("--internal-api-key")
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+    if args.url and args.backend != "local":
+        parser.error("--url needs --backend local to seed accounts")
+
+    results = asyncio.run(run(args))
+    print_table(
+        f"{results['meta']['mode']} loop, {args.duration:.0f}s", results["endpoints"]
+    )
+    print_table("all endpoints", {"total": results["total"]})
+    if results["meta"]["dropped"]:
+        print(f"\n{results['meta']['dropped']} arrivals dropped (--max-in-flight)")
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""Microbenchmarks for the CPU-bound paths: hashing, JWTs, templates, responses.
+
+    python -m benchmarks.micro
+    python -m benchmarks.micro jwt templates --iterations 50000 --output out.json
+
+Each benchmark times single calls in a loop in this process, so no Postgres
+or Redis is needed.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import UTC, datetime
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from benchmarks.report import print_table, run_metadata, summarize, write_results
+from src.api.accounts.keys import key_manager
+from src.api.accounts.schemas import (
+    IntrospectResponseSchema,
+    LoginResponseSchema,
+    UserListSchema,
+    UserResponseSchema,
+)
+from src.api.accounts.utils import (
+    create_access_token,
+    decode_token,
+    is_strong_password,
+    token_cache,
+)
+from src.db.models.user import UserSchema
+from src.settings import settings
+from src.utils.breached_passwords import (
+    BLOCK_BYTES,
+    BreachedPasswordFilter,
+    build_filter,
+    filter_parameters,
+)
+from src.utils.hashing import HashingPool, _hash, _verify
+from src.utils.helpers import render_email, warm_templates
+from src.utils.metrics import MetricsMiddleware
+from src.utils.responses import ORJSONResponse
+from src.utils.schema import ResponseSchema
+from src.utils.tracing import TracingMiddleware, span
+
+PASSWORD = "Bench-Password-1!"
+
+
+def measure(func, iterations: int) -> dict:
+    latencies = []
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        call_started_at = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - call_started_at)
+    return summarize(latencies, time.perf_counter() - started_at)
+
+
+def hashing(args: argparse.Namespace) -> dict:
+    password_hash, _ = _hash(PASSWORD)
+    results = {
+        "argon2-hash": measure(lambda: _hash(PASSWORD), args.hash_iterations),
+        "argon2-verify": measure(
+            lambda: _verify(PASSWORD, password_hash), args.hash_iterations
+        ),
+    }
+
+    async def through_pool() -> dict:
+        pool = HashingPool(pool_size=args.hashing_pool_size, queue_size=1024)
+        pool.start()
+        try:
+            # Start every process before timing anything.
+            await asyncio.gather(
+                *(pool.verify(PASSWORD, password_hash) for _ in range(pool.pool_size))
+            )
+
+            async def timed_verify() -> float:
+                call_started_at = time.perf_counter()
+                await pool.verify(PASSWORD, password_hash)
+                return time.perf_counter() - call_started_at
+
+            started_at = time.perf_counter()
+            latencies = await asyncio.gather(
+                *(timed_verify() for _ in range(args.hash_iterations))
+            )
+            return summarize(latencies, time.perf_counter() - started_at)
+        finally:
+            await pool.shutdown()
+
+    results["hashing-pool-verify"] = asyncio.run(through_pool())
+    return results
+
+
+def jwt(args: argparse.Namespace) -> dict:
+    claims = {"sub": "1", "email": "bench@example.com"}
+    token = create_access_token(claims)
+    token_cache.clear()
+    decode_token(token)
+    return {
+        "jwt-encode": measure(lambda: create_access_token(claims), args.iterations),
+        "jwt-decode-uncached": measure(
+            lambda: key_manager.decode(token), args.iterations
+        ),
+        "jwt-decode-cached": measure(lambda: decode_token(token), args.iterations),
+    }
+
+
+def templates(args: argparse.Namespace) -> dict:
+    warm_templates()
+    context = {"verification_link": "https://example.com/verify?token=benchmark"}
+    return {
+        "render-verification-email": measure(
+            lambda: render_email("verification_email.html", context), args.iterations
+        ),
+    }
+
+
+def metrics(args: argparse.Namespace) -> dict:
+    """Cost of MetricsMiddleware around an app that does nothing."""
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "GET", "path": "/benchmark", "headers": []}
+    instrumented = MetricsMiddleware(app, sample_pools=lambda: None)
+
+    async def run(target) -> dict:
+        latencies = []
+        started_at = time.perf_counter()
+        for _ in range(args.iterations):
+            call_started_at = time.perf_counter()
+            await target(dict(scope), receive, send)
+            latencies.append(time.perf_counter() - call_started_at)
+        return summarize(latencies, time.perf_counter() - started_at)
+
+    return {
+        "asgi-bare": asyncio.run(run(app)),
+        "asgi-metrics-middleware": asyncio.run(run(instrumented)),
+    }
+
+
+def tracing(args: argparse.Namespace) -> dict:
+    """Cost of TracingMiddleware around an app that opens five spans.
+
+    The spans stand in for the Redis, DB, hashing and JWT calls of a login.
+    The exporter is not started, so sampled spans are dropped after the
+    request; exporting happens off the request path anyway.
+    """
+
+    async def app(scope, receive, send):
+        for stage in ("redis", "db", "hashing", "jwt", "jwt"):
+            with span(stage, "operation"):
+                pass
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "GET", "path": "/benchmark", "headers": []}
+
+    async def run(target) -> dict:
+        latencies = []
+        started_at = time.perf_counter()
+        for _ in range(args.iterations):
+            call_started_at = time.perf_counter()
+            await target(dict(scope), receive, send)
+            latencies.append(time.perf_counter() - call_started_at)
+        return summarize(latencies, time.perf_counter() - started_at)
+
+    return {
+        "asgi-spans-untraced": asyncio.run(run(app)),
+        "asgi-tracing-unsampled": asyncio.run(
+            run(TracingMiddleware(app, sample_rate=0.0))
+        ),
+        "asgi-tracing-sampled": asyncio.run(
+            run(TracingMiddleware(app, sample_rate=1.0))
+        ),
+    }
+
+
+def serialization(args: argparse.Namespace) -> dict:
+    """Response rendering of the accounts endpoints, before and after ORJSONResponse.
+
+    `fastapi-default` repeats what FastAPI does with a returned model: dump it
+    to a dict, validate that against the response model, dump it again in JSON
+    mode and json.dumps the result.
+    """
+    now = datetime.now(UTC)
+    users = [
+        UserSchema.model_construct(
+            id=user_id,
+            email=f"user{user_id}@example.com",
+            is_verified=True,
+            created_at=now,
+            updated_at=now,
+        )
+        for user_id in range(1000)
+    ]
+    token = create_access_token({"sub": "1", "email": "user1@example.com"})
+    payload = decode_token(token)
+    responses = {
+        "user-details": (
+            ResponseSchema(success=True, dataSource=users[0].__dict__),
+            ResponseSchema[UserResponseSchema](
+                success=True, dataSource=UserResponseSchema.from_user(users[0])
+            ),
+        ),
+        "login": (LoginResponseSchema(access_token=token, refresh_token=token),) * 2,
+        "introspect-100": (
+            IntrospectResponseSchema(
+                results=[{"active": True, **payload, "sid": payload.get("fid")}] * 100
+            ),
+        )
+        * 2,
+        "users-batch-1000": (
+            ResponseSchema(
+                success=True,
+                dataSource={"users": [user.model_dump() for user in users]},
+            ),
+            ResponseSchema[UserListSchema](
+                success=True,
+                dataSource=UserListSchema(
+                    users=[UserResponseSchema.from_user(user) for user in users]
+                ),
+            ),
+        ),
+    }
+
+    results = {}
+    for name, (before, after) in responses.items():
+        adapter = TypeAdapter(type(before))
+
+        def fastapi_default(model=before, adapter=adapter) -> None:
+            value = adapter.validate_python(model.model_dump())
+            JSONResponse(adapter.dump_python(value, mode="json"))
+
+        iterations = args.iterations // 100 if "1000" in name else args.iterations
+        results[f"{name}-fastapi-default"] = measure(fastapi_default, iterations)
+        results[f"{name}-orjson-response"] = measure(
+            lambda model=after: ORJSONResponse(model), iterations
+        )
+    return results
+
+
+def _filter_lookups(
+    name: str, path: str, members: list[bytes], args: argparse.Namespace
+) -> dict:
+    breached_filter = BreachedPasswordFilter(path)
+    breached_filter.open()
+    try:
+        probes = [os.urandom(20) for _ in range(args.filter_probes)]
+        false_positives = sum(map(breached_filter.contains_digest, probes))
+        misses = iter(probes * (args.iterations // len(probes) + 1))
+        results = {
+            f"{name}-miss": measure(
+                lambda: breached_filter.contains_digest(next(misses)), args.iterations
+            )
+        }
+        results[f"{name}-miss"]["false_positive_rate"] = false_positives / len(probes)
+        if members:
+            hits = iter(members * (args.iterations // len(members) + 1))
+            results[f"{name}-hit"] = measure(
+                lambda: breached_filter.contains_digest(next(hits)), args.iterations
+            )
+        return results
+    finally:
+        breached_filter.close()
+
+
+def passwords(args: argparse.Namespace) -> dict:
+    """Password strength rules and the breached-password filter.
+
+    `breached-filter` is built from `--filter-entries` random digests.
+    `breached-filter-synthetic` is sized for `--filter-synthetic-entries` and
+    filled with random bytes instead: a full bloom filter has about half of
+    its bits set, so lookups touch memory like in a real one of that size,
+    without hashing that many entries. Only its latency is meaningful; the
+    false-positive rate comes from the built filter. Its pages are in the
+    page cache after being written; right after a boot, lookups would first
+    fault them in from disk.
+    """
+    results = {
+        "is-strong-password": measure(
+            lambda: is_strong_password("Correct-Horse-9-battery"), args.iterations
+        )
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        members = [os.urandom(20) for _ in range(args.filter_entries)]
+        path = os.path.join(directory, "built.bloom")
+        build_filter(path, members, len(members), args.filter_false_positive_rate)
+        results.update(_filter_lookups("breached-filter", path, members, args))
+
+        if args.filter_synthetic_entries:
+            path = os.path.join(directory, "synthetic.bloom")
+            build_filter(
+                path, (), args.filter_synthetic_entries, args.filter_false_positive_rate
+            )
+            num_blocks, _ = filter_parameters(
+                args.filter_synthetic_entries, args.filter_false_positive_rate
+            )
+            with open(path, "r+b") as file:
+                remaining = num_blocks * BLOCK_BYTES
+                file.seek(-remaining, os.SEEK_END)
+                while remaining:
+                    chunk = os.urandom(min(remaining, 1 << 24))
+                    file.write(chunk)
+                    remaining -= len(chunk)
+            results.update(_filter_lookups("breached-filter-synthetic", path, [], args))
+
+    for name, row in results.items():
+        if "false_positive_rate" in row:
+            print(
+                f"{name}: false-positive rate {row['false_positive_rate']:.5f} "
+                f"(target {args.filter_false_positive_rate})"
+            )
+    return results
+
+
+BENCHMARKS = {
+    "hashing": hashing,
+    "jwt": jwt,
+    "templates": templates,
+    "metrics": metrics,
+    "tracing": tracing,
+    "serialization": serialization,
+    "passwords": passwords,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("names", nargs="*", help=", ".join(BENCHMARKS))
+    parser.add_argument("--iterations", type=int, default=10_000)
+    parser.add_argument("--hash-iterations", type=int, default=20)
+    parser.add_argument(
+        "--hashing-pool-size", type=int, default=settings.hashing_pool_size
+    )
+    parser.add_argument("--filter-entries", type=int, default=1_000_000)
+    parser.add_argument("--filter-synthetic-entries", type=int, default=500_000_000)
+    parser.add_argument("--filter-probes", type=int, default=200_000)
+    parser.add_argument("--filter-false-positive-rate", type=float, default=0.001)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+    unknown = set(args.names) - BENCHMARKS.keys()
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = {}
+    for name in args.names or BENCHMARKS:
+        results.update(BENCHMARKS[name](args))
+
+    print_table("microbenchmarks", results)
+    write_results(
+        {
+            "meta": run_metadata(
+                benchmark="micro",
+                iterations=args.iterations,
+                hash_iterations=args.hash_iterations,
+                hashing_pool_size=args.hashing_pool_size,
+                filter_entries=args.filter_entries,
+                filter_synthetic_entries=args.filter_synthetic_entries,
+                filter_false_positive_rate=args.filter_false_positive_rate,
+            ),
+            "benchmarks": results,
+        },
+        args.output,
+    )
+
+
+if __name__ == "__main__":
+    main()
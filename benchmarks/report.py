@@ -0,0 +1,99 @@
+import json
+import os
+import platform
+import subprocess
+import time
+from pathlib import Path
+
+from src.settings import settings
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+# Settings that change performance; recorded so two runs can be compared fairly.
+_RECORDED_SETTINGS = (
+    "hashing_pool_size",
+    "hashing_queue_size",
+    "argon2_time_cost",
+    "argon2_memory_cost",
+    "argon2_parallelism",
+    "db_pool_max_size",
+    "redis_max_connections",
+    "user_cache_enabled",
+    "token_cache_max_entries",
+    "authentication_algorithm",
+    "tracing_enabled",
+    "tracing_sample_rate",
+    "tracing_exporter",
+)
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(round(fraction * len(sorted_values) + 0.5) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies: list[float], elapsed: float, errors: int = 0) -> dict:
+    """Throughput and latency distribution; latencies are in seconds."""
+    values = sorted(latencies)
+    count = len(values)
+    return {
+        "count": count,
+        "errors": errors,
+        "throughput_rps": count / elapsed if elapsed else 0.0,
+        "mean_ms": sum(values) / count * 1000 if count else 0.0,
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": values[-1] * 1000 if count else 0.0,
+    }
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_metadata(**extra) -> dict:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {name: getattr(settings, name) for name in _RECORDED_SETTINGS},
+        **extra,
+    }
+
+
+def write_results(results: dict, output: str | None) -> None:
+    if output is None:
+        return
+    path = Path(output)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2, default=str) + "\n")
+    print(f"Results written to {path}")
+
+
+def print_table(title: str, rows: dict[str, dict]) -> None:
+    print(f"\n{title}")
+    print(
+        f"{'name':<34}{'count':>9}{'errors':>8}{'rps':>10}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    )
+    for name, row in rows.items():
+        print(
+            f"{name:<34}{row['count']:>9}{row['errors']:>8}"
+            f"{row['throughput_rps']:>10.1f}{row['p50_ms']:>10.3f}"
+            f"{row['p95_ms']:>10.3f}{row['p99_ms']:>10.3f}"
+        )
@@ -0,0 +1,179 @@
+"""Redis memory and lookup latency of the token revocation markers.
+
+    python -m benchmarks.revocation --backend local --entries 1000000
+    python -m benchmarks.revocation --entries 100000 --output out.json
+
+Fills Redis with `--entries` revoked:{jti} and as many revoked_family:{fid}
+markers, the way `revoke_token` and `revoke_family` write them, and reports
+the growth of `used_memory` per marker. Then times `is_token_revoked` for
+revoked and for valid tokens, and `are_tokens_revoked` for `--batch-size`
+tokens per call, one call at a time. The markers are deleted afterwards.
+
+With the default stub backend the memory figures are not Redis's; use
+`--backend local` against a Redis server like the production one.
+"""
+
+import argparse
+import asyncio
+import time
+
+from redis.exceptions import ResponseError
+
+from benchmarks.report import print_table, run_metadata, summarize, write_results
+from benchmarks.stubs import install_stubs
+from src.api.accounts.revocation import (
+    _revoked_family_key,
+    _revoked_key,
+    are_tokens_revoked,
+    family_ttl,
+    is_token_revoked,
+)
+from src.api.accounts.utils import new_token_id
+from src.db.config import redis, redis_pool
+from src.settings import settings
+
+_PIPELINE_SIZE = 10_000
+
+
+def _payload(jti: str, fid: str) -> dict:
+    now = time.time()
+    return {
+        "sub": "1",
+        "type": "access",
+        "jti": jti,
+        "fid": fid,
+        "iat": round(now, 3),
+        "exp": now + settings.access_token_expire_minutes * 60,
+    }
+
+
+async def _info(section: str) -> dict:
+    try:
+        return await redis.info(section)
+    except ResponseError:
+        # fakeredis has no INFO.
+        return {}
+
+
+async def _write(keys: list[str], ttl: int) -> None:
+    for start in range(0, len(keys), _PIPELINE_SIZE):
+        async with redis.pipeline(transaction=False) as pipe:
+            for key in keys[start : start + _PIPELINE_SIZE]:
+                pipe.set(key, "1", ex=ttl)
+            await pipe.execute()
+
+
+async def _delete(keys: list[str]) -> None:
+    for start in range(0, len(keys), _PIPELINE_SIZE):
+        await redis.delete(*keys[start : start + _PIPELINE_SIZE])
+
+
+async def _time_lookups(check, tokens: list, iterations: int) -> dict:
+    latencies = []
+    started_at = time.perf_counter()
+    for index in range(iterations):
+        call_started_at = time.perf_counter()
+        await check(tokens[index % len(tokens)])
+        latencies.append(time.perf_counter() - call_started_at)
+    return summarize(latencies, time.perf_counter() - started_at)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    if args.backend == "stub":
+        install_stubs()
+    try:
+        return await _run(args)
+    finally:
+        await redis.aclose()
+        await redis_pool.aclose()
+
+
+async def _run(args: argparse.Namespace) -> dict:
+    jtis = [new_token_id() for _ in range(args.entries)]
+    fids = [new_token_id() for _ in range(args.entries)]
+    jti_keys = [_revoked_key(jti) for jti in jtis]
+    fid_keys = [_revoked_family_key(fid) for fid in fids]
+
+    memory_before = (await _info("memory")).get("used_memory")
+    started_at = time.perf_counter()
+    await _write(jti_keys, settings.access_token_expire_minutes * 60)
+    await _write(fid_keys, family_ttl())
+    fill_seconds = time.perf_counter() - started_at
+    memory_after = (await _info("memory")).get("used_memory")
+
+    try:
+        sample = range(0, args.entries, max(args.entries // args.lookups, 1))
+        revoked = [("", _payload(jtis[index], fids[index])) for index in sample]
+        valid = [("", _payload(new_token_id(), new_token_id())) for _ in sample]
+        batches = [
+            valid[start : start + args.batch_size]
+            for start in range(0, len(valid), args.batch_size)
+        ]
+        if not all(await are_tokens_revoked(revoked[: args.batch_size])):
+            raise RuntimeError("revoked tokens were not found in Redis")
+
+        results = {
+            "is-token-revoked-hit": await _time_lookups(
+                lambda token: is_token_revoked(*token), revoked, args.lookups
+            ),
+            "is-token-revoked-miss": await _time_lookups(
+                lambda token: is_token_revoked(*token), valid, args.lookups
+            ),
+            f"are-tokens-revoked-{args.batch_size}": await _time_lookups(
+                are_tokens_revoked, batches, max(args.lookups // args.batch_size, 1)
+            ),
+        }
+    finally:
+        await _delete(jti_keys)
+        await _delete(fid_keys)
+
+    memory = {"entries": 2 * args.entries, "fill_seconds": fill_seconds}
+    if memory_before is not None and memory_after is not None:
+        memory["used_memory_bytes"] = memory_after - memory_before
+        memory["bytes_per_entry"] = (memory_after - memory_before) / (2 * args.entries)
+    server = await _info("server")
+    return {
+        "meta": run_metadata(
+            benchmark="revocation",
+            backend=args.backend,
+            redis_version=server.get("redis_version"),
+            mem_allocator=(await _info("memory")).get("mem_allocator"),
+            entries=args.entries,
+            lookups=args.lookups,
+            batch_size=args.batch_size,
+        ),
+        "memory": memory,
+        "benchmarks": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=("stub", "local"), default="stub")
+    parser.add_argument(
+        "--entries", type=int, default=1_000_000, help="jti and fid markers each"
+    )
+    parser.add_argument("--lookups", type=int, default=10_000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    memory = results["memory"]
+    print(
+        f"{memory['entries']} markers written in {memory['fill_seconds']:.1f}s",
+        end="",
+    )
+    if "bytes_per_entry" in memory:
+        print(
+            f", Redis used_memory +{memory['used_memory_bytes'] / 2**20:.1f} MiB"
+            f" ({memory['bytes_per_entry']:.0f} bytes per marker)",
+            end="",
+        )
+    print()
+    print_table("revocation lookups", results["benchmarks"])
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
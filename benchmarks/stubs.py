@@ -0,0 +1,270 @@
+"""In-process stand-ins for Postgres, Redis and SMTP.
+
+The stand-ins sit below the application's own clients: the Redis pool gets a
+fakeredis connection class, and the Postgres router gets a pool whose
+connections answer the user queries from a dict. Everything above them runs
+unchanged: caching, pinning, Lua scripts, metrics. Absolute numbers from
+stub runs exclude network and database time, so compare stub runs only with
+other stub runs.
+"""
+
+import asyncio
+import itertools
+import os
+import re
+import socketserver
+import threading
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime
+
+from src.db.config import PostgresPool, database, redis_pool
+from src.db.models.user import (
+    CREATE_USER_QUERY,
+    GET_USER_BY_EMAIL_QUERY,
+    GET_USER_BY_ID_QUERY,
+    GET_USERS_BY_IDS_QUERY,
+)
+
+_UPDATE_QUERY = re.compile(
+    r"UPDATE users\s+SET (?P<columns>.+?), updated_at = NOW\(\)\s+"
+    r"WHERE (?P<key_column>\w+) = \$1",
+    re.DOTALL,
+)
+_PUBLIC_COLUMNS = ("id", "email", "is_verified", "created_at", "updated_at")
+
+
+class InMemoryUsers:
+    """The `users` table, shared by every stub connection."""
+
+    def __init__(self):
+        self.by_id: dict[int, dict] = {}
+        self.by_email: dict[str, dict] = {}
+        self._ids = itertools.count(1)
+
+    def insert(self, email: str, password_hash: str) -> dict | None:
+        if email in self.by_email:
+            return None
+        now = datetime.now(UTC)
+        row = {
+            "id": next(self._ids),
+            "email": email,
+            "password_hash": password_hash,
+            "is_verified": False,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self.by_id[row["id"]] = row
+        self.by_email[email] = row
+        return row
+
+
+def _select(row: dict | None, columns: tuple[str, ...]) -> dict | None:
+    return None if row is None else {column: row[column] for column in columns}
+
+
+class StubConnection:
+    """Answers the queries in src/db/models/user.py; anything else is an error."""
+
+    def __init__(self, users: InMemoryUsers, latency: float):
+        self.users = users
+        self.latency = latency
+
+    async def _round_trip(self) -> None:
+        await asyncio.sleep(self.latency)
+
+    async def execute(self, query: str, *args) -> str:
+        await self._round_trip()
+        return "SELECT 1"
+
+    async def fetchrow(self, query: str, *args) -> dict | None:
+        await self._round_trip()
+        if query == CREATE_USER_QUERY:
+            return _select(self.users.insert(*args), _PUBLIC_COLUMNS)
+        if query == GET_USER_BY_EMAIL_QUERY:
+            return _select(
+                self.users.by_email.get(args[0]),
+                ("password_hash", *_PUBLIC_COLUMNS),
+            )
+        if query == GET_USER_BY_ID_QUERY:
+            return _select(
+                self.users.by_id.get(args[0]),
+                ("id", "email", "created_at", "updated_at"),
+            )
+        if query.strip() == "SELECT 1":
+            return {"?column?": 1}
+        if match := _UPDATE_QUERY.search(query):
+            return self._update(match, args)
+        raise NotImplementedError(f"No stub for query: {query.strip()}")
+
+    async def fetch(self, query: str, *args) -> list[dict]:
+        await self._round_trip()
+        if query == GET_USERS_BY_IDS_QUERY:
+            rows = (self.users.by_id.get(user_id) for user_id in args[0])
+            return [
+                _select(row, ("id", "email", "created_at", "updated_at"))
+                for row in rows
+                if row is not None
+            ]
+        raise NotImplementedError(f"No stub for query: {query.strip()}")
+
+    def _update(self, match: re.Match, args: tuple) -> dict | None:
+        key_column = match["key_column"]
+        index = self.users.by_id if key_column == "id" else self.users.by_email
+        row = index.get(args[0])
+        if row is None:
+            return None
+        columns = [part.split("=")[0].strip() for part in match["columns"].split(",")]
+        row.update(zip(columns, args[1:], strict=True))
+        row["updated_at"] = datetime.now(UTC)
+        return _select(row, _PUBLIC_COLUMNS)
+
+    def terminate(self) -> None:
+        pass
+
+
+class StubAsyncpgPool:
+    """Bounded like asyncpg.Pool, so pool saturation still shows up in results."""
+
+    def __init__(self, users: InMemoryUsers, max_size: int, latency: float):
+        self._max_size = max_size
+        self._idle = [StubConnection(users, latency) for _ in range(max_size)]
+        self._available = asyncio.Semaphore(max_size)
+
+    async def acquire(self) -> StubConnection:
+        await self._available.acquire()
+        return self._idle.pop()
+
+    async def release(self, connection: StubConnection) -> None:
+        self._idle.append(connection)
+        self._available.release()
+
+    async def close(self) -> None:
+        pass
+
+    def get_size(self) -> int:
+        return self._max_size
+
+    def get_idle_size(self) -> int:
+        return len(self._idle)
+
+    def get_max_size(self) -> int:
+        return self._max_size
+
+
+class StubPostgresPool(PostgresPool):
+    def __init__(self, users: InMemoryUsers, max_size: int, latency: float):
+        super().__init__(
+            dsn="stub://",
+            min_size=max_size,
+            max_size=max_size,
+            statement_cache_size=0,
+            command_timeout=0,
+            pre_ping=False,
+        )
+        self.users = users
+        self.latency = latency
+
+    async def connect(self) -> None:
+        self.pool = StubAsyncpgPool(self.users, self.max_size, self.latency)
+
+
+def install_stubs(db_latency: float = 0.0) -> InMemoryUsers:
+    """Point the application's Postgres router and Redis pool at stand-ins.
+
+    Must run before the application lifespan starts. `db_latency` adds a
+    fixed delay to every query to approximate a database round trip.
+    """
+    import fakeredis
+    from fakeredis.aioredis import FakeConnection
+
+    users = InMemoryUsers()
+    database.primary = StubPostgresPool(
+        users, max_size=database.primary.max_size, latency=db_latency
+    )
+    database.replicas = []
+    database._healthy = {}
+
+    redis_pool.connection_class = FakeConnection
+    redis_pool.connection_kwargs = {
+        "server": fakeredis.FakeServer(),
+        "decode_responses": True,
+    }
+    return users
+
+
+class _SMTPSession(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: accepts every message without AUTH."""
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self) -> None:
+        self.reply("220 smtp-sink ready")
+        while line := self.rfile.readline():
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250-smtp-sink")
+                self.reply("250 8BITMIME")
+            elif command == "DATA":
+                self.reply("354 end data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                self.server.record_message()
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Dummy SMTP server on localhost that counts and discards messages."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port: int = 0):
+        super().__init__(("127.0.0.1", port), _SMTPSession)
+        self.messages = 0
+        self._lock = threading.Lock()
+
+    def record_message(self) -> None:
+        with self._lock:
+            self.messages += 1
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+@asynccontextmanager
+async def smtp_sink():
+    """Run an SMTPSink and point SMTPEmailHandler at it for the block."""
+    sink = SMTPSink()
+    sink.start()
+    overrides = {
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": str(sink.port),
+        "SMTP_USE_SSL": "false",
+        "SMTP_EMAIL": "bench@example.com",
+        "SMTP_PASSWORD": "unused",
+    }
+    previous = {key: os.environ.get(key) for key in overrides}
+    os.environ.update(overrides)
+    try:
+        yield sink
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        sink.stop()
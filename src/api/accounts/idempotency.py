@@ -0,0 +1,83 @@
+"""Stored outcomes of requests sent with an `Idempotency-Key` header.
+
+A retried registration with the same key gets the first attempt's outcome,
+the created user or the 4xx error, instead of running again. Outcomes are
+kept for `idempotency_ttl_seconds` under a hash of the key, together with a
+fingerprint of the request; reusing a key for a different request is a 422.
+The fingerprint covers the password, so it is keyed with the server secret
+to keep it from being brute-forced out of Redis. Internal errors are not
+stored, so those requests can be retried.
+"""
+
+import hashlib
+
+import orjson
+from fastapi import status
+
+from src.db.config import redis
+from src.db.models.user import UserSchema
+from src.settings import settings
+from src.utils.schema import CustomException
+
+MAX_KEY_LENGTH = 255
+_FINGERPRINT_KEY = hashlib.sha256(settings.authentication_secret_key.encode()).digest()
+
+
+def fingerprint(*parts: str) -> str:
+    """Keyed hash of request parts that may include a password."""
+    return hashlib.blake2b(
+        "\0".join(parts).encode(), digest_size=16, key=_FINGERPRINT_KEY
+    ).hexdigest()
+
+
+def check_key(idempotency_key: str) -> None:
+    if not 0 < len(idempotency_key) <= MAX_KEY_LENGTH:
+        raise CustomException(
+            message=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters.",
+            error="invalid_idempotency_key",
+            error_code=status.HTTP_400_BAD_REQUEST,
+        )
+
+
+async def get_outcome(
+    scope: str, idempotency_key: str, *request_parts: str
+) -> UserSchema | None:
+    """Replay a stored outcome: return its user, or raise its error."""
+    stored = await redis.get(f"idempotency:{scope}:{fingerprint(idempotency_key)}")
+    if stored is None:
+        return None
+    outcome = orjson.loads(stored)
+    if outcome["fingerprint"] != fingerprint(*request_parts):
+        raise CustomException(
+            message="This Idempotency-Key was already used for a different request.",
+            error="idempotency_key_reused",
+            error_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+        )
+    if "error" in outcome:
+        error = outcome["error"]
+        raise CustomException(
+            message=error["message"],
+            error=error["error"],
+            error_code=outcome["status_code"],
+        )
+    return UserSchema.model_validate(outcome["user"])
+
+
+async def store_outcome(
+    scope: str,
+    idempotency_key: str,
+    request_parts: tuple[str, ...],
+    user: UserSchema | None = None,
+    error: CustomException | None = None,
+) -> None:
+    outcome = {"fingerprint": fingerprint(*request_parts)}
+    if error is not None:
+        outcome["status_code"] = error.status_code
+        outcome["error"] = error.detail
+    else:
+        outcome["user"] = user.model_dump(mode="json", exclude={"password_hash"})
+    await redis.set(
+        f"idempotency:{scope}:{fingerprint(idempotency_key)}",
+        orjson.dumps(outcome),
+        ex=settings.idempotency_ttl_seconds,
+    )
@@ -0,0 +1,125 @@
+"""Signing and verification keys for access and refresh tokens.
+
+With `authentication_keys_dir` set, tokens are signed with an asymmetric key
+(ES256/RS256, per `authentication_algorithm`) and carry a `kid` header. The
+directory holds one PEM file per key:
+
+- `{kid}.pem`: private key, can sign and verify
+- `{kid}.pub.pem`: public key of a retired signing key, verify only
+
+`authentication_active_kid` selects the signing key (defaults to the last
+private key in sorted order). To rotate keys, add the new key, publish it
+through the JWKS endpoint, switch the active kid, and move the old key to
+`.pub.pem` until every token it signed has expired.
+
+Without a keys directory, tokens are signed with the shared
+`authentication_secret_key`, as before, and no keys are published.
+
+Every key is parsed once when this module is imported, never per token.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+from jose import JWTError, jwk, jwt
+from jose.backends.base import Key
+
+from src.settings import settings
+from src.utils.tracing import span
+
+
+class KeyManager:
+    def __init__(
+        self,
+        algorithm: str,
+        secret_key: str,
+        keys_dir: str | None = None,
+        active_kid: str | None = None,
+        legacy_algorithm: str | None = None,
+    ):
+        self.algorithm = algorithm
+        self.signing_kid: str | None = None
+        self._signing_key: Key
+        self._verification_keys: dict[str, Key] = {}
+        self._legacy_key: Key | None = None
+        self._legacy_algorithm = legacy_algorithm
+
+        if keys_dir:
+            self._load_keys_dir(Path(keys_dir), active_kid)
+            if legacy_algorithm:
+                self._legacy_key = jwk.construct(secret_key, legacy_algorithm)
+        else:
+            self._signing_key = jwk.construct(secret_key, algorithm)
+            self._legacy_key = self._signing_key
+            self._legacy_algorithm = algorithm
+
+        self.jwks_body = json.dumps(
+            {"keys": self.public_jwks()}, separators=(",", ":")
+        ).encode()
+        self.jwks_etag = f'"{hashlib.sha256(self.jwks_body).hexdigest()[:32]}"'
+
+    def _load_keys_dir(self, keys_dir: Path, active_kid: str | None) -> None:
+        private_keys = {}
+        for path in sorted(keys_dir.glob("*.pem")):
+            is_public = path.name.endswith(".pub.pem")
+            kid = path.name.removesuffix(".pub.pem" if is_public else ".pem")
+            key = jwk.construct(path.read_bytes(), self.algorithm)
+            if is_public:
+                self._verification_keys.setdefault(kid, key)
+            else:
+                private_keys[kid] = key
+                self._verification_keys[kid] = key.public_key()
+
+        if not private_keys:
+            raise ValueError(f"No private signing keys found in {keys_dir}")
+        self.signing_kid = active_kid or list(private_keys)[-1]
+        if self.signing_kid not in private_keys:
+            raise ValueError(f"Active signing key {self.signing_kid} not found")
+        self._signing_key = private_keys[self.signing_kid]
+
+    def public_jwks(self) -> list[dict]:
+        return [
+            {
+                **key.to_dict(),
+                "kid": kid,
+                "use": "sig",
+                "alg": self.algorithm,
+            }
+            for kid, key in self._verification_keys.items()
+        ]
+
+    def encode(self, claims: dict) -> str:
+        headers = {"kid": self.signing_kid} if self.signing_kid else None
+        with span("jwt", "encode"):
+            return jwt.encode(
+                claims, self._signing_key, algorithm=self.algorithm, headers=headers
+            )
+
+    def decode(self, token: str) -> dict:
+        """Verify a token and return its claims; raises `JWTError` if invalid."""
+        with span("jwt", "decode"):
+            return self._decode(token)
+
+    def _decode(self, token: str) -> dict:
+        kid = jwt.get_unverified_header(token).get("kid")
+        if kid is None:
+            if self._legacy_key is None:
+                raise JWTError("Token has no key id")
+            return jwt.decode(
+                token, self._legacy_key, algorithms=[self._legacy_algorithm]
+            )
+
+        key = self._verification_keys.get(kid)
+        if key is None:
+            raise JWTError(f"Unknown key id {kid}")
+        return jwt.decode(token, key, algorithms=[self.algorithm])
+
+
+key_manager = KeyManager(
+    algorithm=settings.authentication_algorithm,
+    secret_key=settings.authentication_secret_key,
+    keys_dir=settings.authentication_keys_dir,
+    active_kid=settings.authentication_active_kid,
+    legacy_algorithm=settings.authentication_legacy_algorithm,
+)
@@ -0,0 +1,144 @@
+"""Token revocation state kept in Redis.
+
+Tokens carry a compact `jti` (token id) and `fid` (refresh-token family id),
+so revocation stores short `revoked:{jti}` / `revoked_family:{fid}` markers
+instead of the full JWT. Every refresh rotation keeps the family id, which
+lets reuse of an already-rotated refresh token revoke the whole family in
+one operation. Revoking every session of a user is a single per-user
+`tokens_valid_after:{user_id}` watermark compared against the token's `iat`.
+
+Tokens issued before jti/fid existed are still checked against the legacy
+`blacklist:{token}` keys. Those keys expire with the tokens they cover, so the
+legacy branches can be removed once `refresh_token_expire_days` have passed
+since the rollout.
+"""
+
+import time
+
+from src.db.config import redis
+from src.settings import settings
+
+# KEYS[1] = revoked:{jti}, KEYS[2] = revoked_family:{fid},
+# KEYS[3] = tokens_valid_after:{user_id}
+# ARGV[1] = seconds until the token expires, ARGV[2] = family revocation TTL,
+# ARGV[3] = the token's iat
+_CONSUME_REFRESH_TOKEN = redis.register_script(
+    """
+    if redis.call('EXISTS', KEYS[2]) == 1 then
+        return 0
+    end
+    local valid_after = redis.call('GET', KEYS[3])
+    if valid_after and tonumber(ARGV[3]) < tonumber(valid_after) then
+        return 0
+    end
+    if redis.call('SET', KEYS[1], '1', 'EX', ARGV[1], 'NX') then
+        return 1
+    end
+    redis.call('SET', KEYS[2], '1', 'EX', ARGV[2])
+    return 0
+    """
+)
+
+
+def _revoked_key(jti: str) -> str:
+    return f"revoked:{jti}"
+
+
+def _revoked_family_key(family_id: str) -> str:
+    return f"revoked_family:{family_id}"
+
+
+def tokens_valid_after_key(user_id) -> str:
+    return f"tokens_valid_after:{user_id}"
+
+
+def _legacy_key(token: str) -> str:
+    return f"blacklist:{token}"
+
+
+def _remaining_ttl(payload: dict) -> int:
+    return max(int(payload.get("exp", 0) - time.time()), 1)
+
+
+def family_ttl() -> int:
+    # Outlives every token that may still be issued in the family.
+    return settings.refresh_token_expire_days * 24 * 3600
+
+
+def _revocation_keys(token: str, payload: dict) -> list[str]:
+    jti = payload.get("jti")
+    if not jti:
+        return [_legacy_key(token)]
+
+    keys = [_revoked_key(jti), tokens_valid_after_key(payload.get("sub"))]
+    if payload.get("fid"):
+        keys.append(_revoked_family_key(payload["fid"]))
+    return keys
+
+
+def _is_revoked(payload: dict, values: list) -> bool:
+    if not payload.get("jti"):
+        return bool(values[0])
+
+    is_revoked, valid_after, *is_family_revoked = values
+    if valid_after and payload.get("iat", 0) < float(valid_after):
+        return True
+    return bool(is_revoked) or any(is_family_revoked)
+
+
+async def are_tokens_revoked(tokens: list[tuple[str, dict]]) -> list[bool]:
+    """Check many decoded tokens against the revocation state in one MGET."""
+    if not tokens:
+        return []
+
+    key_groups = [_revocation_keys(token, payload) for token, payload in tokens]
+    values = await redis.mget([key for keys in key_groups for key in keys])
+
+    results = []
+    offset = 0
+    for (_, payload), keys in zip(tokens, key_groups, strict=True):
+        results.append(_is_revoked(payload, values[offset : offset + len(keys)]))
+        offset += len(keys)
+    return results
+
+
+async def is_token_revoked(token: str, payload: dict) -> bool:
+    (is_revoked,) = await are_tokens_revoked([(token, payload)])
+    return is_revoked
+
+
+async def revoke_token(token: str, payload: dict) -> None:
+    jti = payload.get("jti")
+    key = _revoked_key(jti) if jti else _legacy_key(token)
+    await redis.set(key, "1", ex=_remaining_ttl(payload))
+
+
+async def revoke_family(family_id: str) -> None:
+    await redis.set(_revoked_family_key(family_id), "1", ex=family_ttl())
+
+
+async def consume_refresh_token(token: str, payload: dict) -> bool:
+    """Mark a refresh token as used, in one round trip.
+
+    Returns False when the token was already used or its family is revoked.
+    Reuse of a rotated token also revokes the family, which invalidates every
+    token issued from the same login.
+    """
+    jti = payload.get("jti")
+    family_id = payload.get("fid")
+    if not jti or not family_id:
+        return bool(
+            await redis.set(
+                _legacy_key(token), "1", ex=_remaining_ttl(payload), nx=True
+            )
+        )
+
+    is_first_use = await _CONSUME_REFRESH_TOKEN(
+        keys=[
+            _revoked_key(jti),
+            _revoked_family_key(family_id),
+            tokens_valid_after_key(payload.get("sub")),
+        ],
+        args=[_remaining_ttl(payload), family_ttl(), payload.get("iat", 0)],
+    )
+    return bool(is_first_use)
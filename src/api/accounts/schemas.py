@@ -1,5 +1,11 @@
+from datetime import datetime
+from typing import Literal
+
 from pydantic import BaseModel, EmailStr, Field
 
+from src.db.models.user import UserSchema
+from src.settings import settings
+
 
 # Request schemas
 class SignupRequestSchema(BaseModel):
@@ -19,3 +25,72 @@ class LoginResponseSchema(BaseModel):
 
 class RefreshRequestSchema(BaseModel):
     refresh_token: str
+
+
+class UserBatchRequestSchema(BaseModel):
+    ids: list[int] = Field(..., min_length=1, max_length=settings.user_batch_max_ids)
+
+
+class IntrospectRequestSchema(BaseModel):
+    tokens: list[str] = Field(
+        ..., min_length=1, max_length=settings.introspection_max_batch
+    )
+
+
+class IntrospectResultSchema(BaseModel):
+    active: Literal[True]
+    sub: str | None = None
+    username: str | None = None
+    token_type: str | None = None
+    exp: int | None = None
+    iat: float | None = None
+    jti: str | None = None
+    sid: str | None = None
+
+
+class InactiveIntrospectResultSchema(BaseModel):
+    """An unknown, expired or revoked token; RFC 7662 returns nothing else."""
+
+    active: Literal[False]
+
+
+class IntrospectResponseSchema(BaseModel):
+    results: list[IntrospectResultSchema | InactiveIntrospectResultSchema]
+
+
+class UserResponseSchema(BaseModel):
+    """Public view of a user; never includes the password hash."""
+
+    id: int
+    email: str
+    is_verified: bool | None = None
+    created_at: datetime
+    updated_at: datetime
+
+    @classmethod
+    def from_user(cls, user: UserSchema) -> "UserResponseSchema":
+        # The user was built from a typed DB record, so skip validation.
+        return cls.model_construct(
+            id=user.id,
+            email=user.email,
+            is_verified=user.is_verified,
+            created_at=user.created_at,
+            updated_at=user.updated_at,
+        )
+
+
+class UserListSchema(BaseModel):
+    users: list[UserResponseSchema]
+
+
+class SessionSchema(BaseModel):
+    session_id: str
+    user_agent: str | None = None
+    ip_address: str | None = None
+    created_at: int
+    expires_at: int
+    is_current: bool = False
+
+
+class SessionListSchema(BaseModel):
+    sessions: list[SessionSchema]
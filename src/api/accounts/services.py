@@ -1,6 +1,6 @@
-import json
+import asyncio
 import logging
-from datetime import UTC, datetime
+from collections.abc import AsyncIterator
 from uuid import uuid4
 
 from fastapi import status
@@ -11,25 +11,102 @@ from src.db.models.user import (
     create_user,
     get_user_by_email,
     get_user_by_id,
+    get_users_by_ids,
     update_user_by_email,
     update_user_by_id,
 )
-from src.externals.smtp import SMTPEmailHandler
+from src.externals.outbox import enqueue_email
 from src.settings import settings
+from src.utils.breached_passwords import breached_password_filter
+from src.utils.metrics import PASSWORD_REHASHES
 from src.utils.schema import CustomException
-
+from src.utils.single_flight import SingleFlight, redis_lock
+
+from .idempotency import check_key, fingerprint, get_outcome, store_outcome
+from .revocation import (
+    are_tokens_revoked,
+    consume_refresh_token,
+    is_token_revoked,
+    revoke_token,
+)
+from .sessions import (
+    add_session,
+    extend_session,
+    list_sessions,
+    remove_session,
+    revoke_all_sessions,
+)
 from .utils import (
     create_authentication_tokens,
     decode_token,
+    forget_token,
     get_password_hash,
     is_strong_password,
-    verify_password,
+    new_token_id,
+    verify_and_update_password,
 )
 
 logger = logging.getLogger("stdout")
 
+# Strong references to in-flight rehash writes, so they are not collected.
+_rehash_tasks: set[asyncio.Task] = set()
+
+# Identical registrations in flight in this worker run once. Across workers,
+# and for different requests for the same email, they take turns on a Redis
+# lock, so only the first hashes the password, writes and sends the email.
+registrations = SingleFlight("register")
+
+
+async def register(
+    email: str, password: str, idempotency_key: str | None = None
+) -> UserSchema:
+    if idempotency_key is not None:
+        check_key(idempotency_key)
+    # Keyed on a fingerprint, so the plaintext password is not held as a key.
+    return await registrations.do(
+        (email, fingerprint(password), idempotency_key),
+        _register_once,
+        email,
+        password,
+        idempotency_key,
+    )
+
+
+async def _register_once(
+    email: str, password: str, idempotency_key: str | None
+) -> UserSchema:
+    async with redis_lock("register", email):
+        if idempotency_key is None:
+            return await _register(email, password)
+
+        try:
+            user = await get_outcome("register", idempotency_key, email, password)
+        except CustomException:
+            raise
+        except Exception as e:
+            logger.error("Error reading idempotency key: %s", e)
+            user = None
+        if user is not None:
+            return user
+
+        try:
+            user = await _register(email, password)
+        except CustomException as e:
+            if e.status_code < 500:
+                await _store_outcome(idempotency_key, email, password, error=e)
+            raise
+        await _store_outcome(idempotency_key, email, password, user=user)
+        return user
+
+
+async def _store_outcome(idempotency_key: str, *request_parts: str, **outcome):
+    try:
+        await store_outcome("register", idempotency_key, request_parts, **outcome)
+    except Exception as e:
+        logger.error("Error storing idempotency key: %s", e)
+
 
-async def register(email: str, password: str) -> UserSchema:
+async def _register(email: str, password: str) -> UserSchema:
     try:
         existing_user = await get_user_by_email(email)
         if existing_user:
@@ -42,9 +119,9 @@ async def register(email: str, password: str) -> UserSchema:
             else:
                 cache = None
                 try:
-                    cache = redis.get(f"email_verification: {email}")
+                    cache = await redis.get(f"email_verification: {email}")
                 except Exception as e:
-                    logger.error(f"Error fetching email verification cache: {e}")
+                    logger.error("Error fetching email verification cache: %s", e)
 
                 if cache:
                     raise CustomException(
@@ -59,8 +136,14 @@ async def register(email: str, password: str) -> UserSchema:
                 error="weak_password",
                 error_code=status.HTTP_400_BAD_REQUEST,
             )
+        if breached_password_filter.contains(password):
+            raise CustomException(
+                message="This password has appeared in a data breach. Please choose a different one.",
+                error="breached_password",
+                error_code=status.HTTP_400_BAD_REQUEST,
+            )
 
-        password_hash = get_password_hash(password)
+        password_hash = await get_password_hash(password)
         if not existing_user:
             user = await create_user(email=email, password_hash=password_hash)
         else:
@@ -74,26 +157,34 @@ async def register(email: str, password: str) -> UserSchema:
             settings.base_url
             + f"/api/accounts/verify-email?email={email}&token={token}"
         )
-        SMTPEmailHandler().send_verification_email(
-            to_email=email, verification_link=verification_link
+        await enqueue_email(
+            to_email=email,
+            subject="Verify Your Email Address",
+            template="verification_email.html",
+            context={"verification_link": verification_link},
         )
 
-        redis.set(f"email_verification: {email}", str(token), ex=3600 * 24)
+        await redis.set(f"email_verification: {email}", str(token), ex=3600 * 24)
     except CustomException:
         raise
     except Exception as e:
-        logger.error(f"Error while registering for email {email}: {e}")
+        logger.error("Error while registering for email %s: %s", email, e)
         raise CustomException(
             message="Registration failed due to an internal error.",
             error="registration_failed",
             error_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         ) from e
-    return user.__dict__ if user else {}
+    return user
 
 
-async def login(email: str, password: str) -> tuple[str, str]:
+async def login(
+    email: str,
+    password: str,
+    user_agent: str | None = None,
+    ip_address: str | None = None,
+) -> tuple[str, str]:
     try:
-        user = await get_user_by_email(email)
+        user = await get_user_by_email(email, with_password_hash=True)
         if not user or not user.is_verified:
             raise CustomException(
                 message="Invalid email",
@@ -101,21 +192,31 @@ async def login(email: str, password: str) -> tuple[str, str]:
                 error_code=status.HTTP_401_UNAUTHORIZED,
             )
 
-        if not verify_password(password, user.password_hash):
+        is_valid, new_hash = await verify_and_update_password(
+            password, user.password_hash
+        )
+        if not is_valid:
             raise CustomException(
                 message="Invalid password",
                 error="invalid_credentials",
                 error_code=status.HTTP_401_UNAUTHORIZED,
             )
-
-        access_token, refresh_token = create_authentication_tokens(user.id, user.email)
-        redis.set(
-            f"auth: {access_token}",
-            json.dumps({"user_id": user.id, "email": user.email}),
-            ex=settings.access_token_expire_minutes * 60,
+        if new_hash:
+            task = asyncio.create_task(_store_rehash(user.id, new_hash))
+            _rehash_tasks.add(task)
+            task.add_done_callback(_rehash_tasks.discard)
+
+        session_id = new_token_id()
+        access_token, refresh_token = create_authentication_tokens(
+            user.id, user.email, family_id=session_id
+        )
+        await add_session(
+            user.id, session_id, user_agent=user_agent, ip_address=ip_address
         )
+    except CustomException:
+        raise
     except Exception as e:
-        logger.error(f"Error during login for email {email}: {e}")
+        logger.error("Error during login for email %s: %s", email, e)
         raise CustomException(
             message="Login failed due to an internal error.",
             error="login_failed",
@@ -125,15 +226,17 @@ async def login(email: str, password: str) -> tuple[str, str]:
     return access_token, refresh_token
 
 
-async def refresh_tokens(refresh_token: str) -> tuple[str, str]:
-    is_blacklisted = redis.get(f"blacklist:{refresh_token}")
-    if is_blacklisted:
-        raise CustomException(
-            message="Refresh token has been revoked",
-            error="token_revoked",
-            error_code=status.HTTP_401_UNAUTHORIZED,
-        )
+async def _store_rehash(user_id: int, new_hash: str) -> None:
+    """Save a hash recomputed with the current argon2 parameters at login."""
+    try:
+        await update_user_by_id(user_id, {"password_hash": new_hash})
+        PASSWORD_REHASHES.labels("updated").inc()
+    except Exception as e:
+        PASSWORD_REHASHES.labels("error").inc()
+        logger.error("Failed to store rehashed password for user %s: %s", user_id, e)
+
 
+async def refresh_tokens(refresh_token: str) -> tuple[str, str]:
     payload = decode_token(refresh_token)
     if not payload:
         raise CustomException(
@@ -160,15 +263,18 @@ async def refresh_tokens(refresh_token: str) -> tuple[str, str]:
             error_code=status.HTTP_400_BAD_REQUEST,
         ) from exc
 
-    exp = payload.get("exp")
-    if exp:
-        from datetime import UTC, datetime
-
-        ttl = exp - int(datetime.now(UTC).timestamp())
-        if ttl > 0:
-            redis.setex(f"blacklist:{refresh_token}", ttl, "1")
+    if not await consume_refresh_token(refresh_token, payload):
+        raise CustomException(
+            message="Refresh token has been revoked",
+            error="token_revoked",
+            error_code=status.HTTP_401_UNAUTHORIZED,
+        )
 
-    access_token, new_refresh_token = create_authentication_tokens(user_id, email)
+    access_token, new_refresh_token = create_authentication_tokens(
+        user_id, email, family_id=payload.get("fid")
+    )
+    if payload.get("fid"):
+        await extend_session(user_id, payload["fid"])
     return access_token, new_refresh_token
 
 
@@ -181,18 +287,17 @@ async def logout(token: str) -> bool:
             error_code=status.HTTP_401_UNAUTHORIZED,
         )
 
-    exp = payload.get("exp")
-    if exp:
-        ttl = exp - int(datetime.now(UTC).timestamp())
-        if ttl > 0:
-            redis.setex(f"blacklist:{token}", ttl, "1")
+    await revoke_token(token, payload)
+    if payload.get("fid"):
+        await remove_session(payload.get("sub"), payload["fid"])
+    forget_token(token)
 
     return True
 
 
 async def verify_email(email: str, token: str) -> bool:
     try:
-        cache_token = redis.get(f"email_verification: {email}")
+        cache_token = await redis.get(f"email_verification: {email}")
         if not cache_token or cache_token != token:
             raise CustomException(
                 message="Invalid or expired email verification token",
@@ -209,14 +314,14 @@ async def verify_email(email: str, token: str) -> bool:
                 error="invalid_user",
                 error_code=status.HTTP_404_NOT_FOUND,
             )
-        redis.delete(f"email_verification: {email}")
+        await redis.delete(f"email_verification: {email}")
         return True
     except Exception as e:
-        logger.error(f"Error verifying email: {e}")
+        logger.error("Error verifying email: %s", e)
         return False
 
 
-async def get_user_details(token: str) -> UserSchema:
+async def authenticate_access_token(token: str) -> dict:
     payload = decode_token(token)
     if not payload:
         raise CustomException(
@@ -233,6 +338,20 @@ async def get_user_details(token: str) -> UserSchema:
             error_code=status.HTTP_400_BAD_REQUEST,
         )
 
+    # Decoded claims may come from the per-worker cache, so revocation is
+    # always checked against Redis.
+    if await is_token_revoked(token, payload):
+        raise CustomException(
+            message="Access token has been revoked",
+            error="token_revoked",
+            error_code=status.HTTP_401_UNAUTHORIZED,
+        )
+    return payload
+
+
+async def get_user_details(token: str) -> UserSchema:
+    payload = await authenticate_access_token(token)
+
     try:
         user_id = int(payload.get("sub"))
         user = await get_user_by_id(user_id)
@@ -249,4 +368,58 @@ async def get_user_details(token: str) -> UserSchema:
             error_code=status.HTTP_400_BAD_REQUEST,
         ) from exc
 
-    return user.__dict__ if user else {}
+    return user
+
+
+async def get_sessions(token: str) -> list[dict]:
+    payload = await authenticate_access_token(token)
+    sessions = await list_sessions(int(payload["sub"]))
+    for session in sessions:
+        session["is_current"] = session["session_id"] == payload.get("fid")
+    return sessions
+
+
+async def logout_everywhere(token: str) -> bool:
+    payload = await authenticate_access_token(token)
+    await revoke_all_sessions(int(payload["sub"]))
+    forget_token(token)
+    return True
+
+
+async def introspect_tokens(tokens: list[str]) -> list[dict]:
+    """RFC 7662 style introspection using signatures and Redis state only."""
+    decoded = [(token, decode_token(token)) for token in tokens]
+    verified = [(token, payload) for token, payload in decoded if payload]
+    revoked_flags = iter(await are_tokens_revoked(verified))
+
+    results = []
+    for _, payload in decoded:
+        if not payload or next(revoked_flags):
+            results.append({"active": False})
+            continue
+        results.append(
+            {
+                "active": True,
+                "sub": payload.get("sub"),
+                "username": payload.get("email"),
+                "token_type": payload.get("type"),
+                "exp": payload.get("exp"),
+                "iat": payload.get("iat"),
+                "jti": payload.get("jti"),
+                "sid": payload.get("fid"),
+            }
+        )
+    return results
+
+
+async def get_users_details(user_ids: list[int]) -> list[UserSchema]:
+    return await get_users_by_ids(user_ids)
+
+
+async def iter_users_details(
+    user_ids: list[int], page_size: int
+) -> AsyncIterator[list[UserSchema]]:
+    """Yield the users in pages of `page_size` ids, one query per page."""
+    user_ids = list(dict.fromkeys(user_ids))
+    for start in range(0, len(user_ids), page_size):
+        yield await get_users_by_ids(user_ids[start : start + page_size])
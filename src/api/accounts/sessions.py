@@ -0,0 +1,107 @@
+"""Per-user index of active sessions.
+
+A session is one login, identified by the refresh-token family id it issued.
+Each user has a `sessions:{user_id}` hash holding device metadata per session
+and a `session_expiry:{user_id}` sorted set scoring sessions by expiry time.
+Expired members are removed lazily when the sessions are listed.
+"""
+
+import json
+import math
+import time
+
+from src.db.config import redis
+from src.settings import settings
+
+from .revocation import family_ttl, revoke_family, tokens_valid_after_key
+
+
+def _sessions_key(user_id: int) -> str:
+    return f"sessions:{user_id}"
+
+
+def _expiry_key(user_id: int) -> str:
+    return f"session_expiry:{user_id}"
+
+
+def _session_lifetime() -> int:
+    return settings.refresh_token_expire_days * 24 * 3600
+
+
+async def add_session(
+    user_id: int,
+    session_id: str,
+    user_agent: str | None = None,
+    ip_address: str | None = None,
+) -> None:
+    now = time.time()
+    metadata = {
+        "session_id": session_id,
+        "user_agent": user_agent,
+        "ip_address": ip_address,
+        "created_at": int(now),
+    }
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hset(_sessions_key(user_id), session_id, json.dumps(metadata))
+        pipe.zadd(_expiry_key(user_id), {session_id: now + _session_lifetime()})
+        pipe.expire(_sessions_key(user_id), _session_lifetime())
+        pipe.expire(_expiry_key(user_id), _session_lifetime())
+        await pipe.execute()
+
+
+async def extend_session(user_id: int, session_id: str) -> None:
+    """Push a session's expiry forward after its refresh token was rotated."""
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.zadd(
+            _expiry_key(user_id),
+            {session_id: time.time() + _session_lifetime()},
+            xx=True,
+        )
+        pipe.expire(_sessions_key(user_id), _session_lifetime())
+        pipe.expire(_expiry_key(user_id), _session_lifetime())
+        await pipe.execute()
+
+
+async def list_sessions(user_id: int) -> list[dict]:
+    now = time.time()
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.hgetall(_sessions_key(user_id))
+        pipe.zrange(_expiry_key(user_id), 0, -1, withscores=True)
+        metadata_by_id, expiries = await pipe.execute()
+
+    sessions = []
+    expired_ids = []
+    for session_id, expires_at in expiries:
+        metadata = metadata_by_id.get(session_id)
+        if expires_at <= now or metadata is None:
+            expired_ids.append(session_id)
+            continue
+        sessions.append({**json.loads(metadata), "expires_at": int(expires_at)})
+
+    if expired_ids:
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.hdel(_sessions_key(user_id), *expired_ids)
+            pipe.zrem(_expiry_key(user_id), *expired_ids)
+            await pipe.execute()
+    return sessions
+
+
+async def remove_session(user_id: int, session_id: str) -> None:
+    """End one session and revoke every token issued for it."""
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hdel(_sessions_key(user_id), session_id)
+        pipe.zrem(_expiry_key(user_id), session_id)
+        await pipe.execute()
+    await revoke_family(session_id)
+
+
+async def revoke_all_sessions(user_id: int) -> None:
+    """Invalidate every token issued to the user so far, in one round trip."""
+    # Token iat is rounded to the millisecond, so floor the watermark to it:
+    # a token issued just after this call may carry an iat slightly below
+    # time.time() and must not be rejected.
+    valid_after = math.floor(time.time() * 1000) / 1000
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.set(tokens_valid_after_key(user_id), valid_after, ex=family_ttl())
+        pipe.delete(_sessions_key(user_id), _expiry_key(user_id))
+        await pipe.execute()
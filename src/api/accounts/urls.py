@@ -1,12 +1,71 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 
 from src.api.accounts import views
+from src.api.accounts.schemas import (
+    IntrospectResponseSchema,
+    LoginResponseSchema,
+    SessionListSchema,
+    UserListSchema,
+    UserResponseSchema,
+)
+from src.utils.rate_limit import limit_login, limit_register
+from src.utils.schema import MessageResponseSchema, ResponseSchema
 
 router = APIRouter()
 
-router.add_api_route("/register", views.register_view, methods=["POST"])
-router.add_api_route("/login", views.login_view, methods=["POST"])
-router.add_api_route("/refresh", views.refresh_view, methods=["POST"])
-router.add_api_route("/logout", views.logout_view, methods=["POST"])
-router.add_api_route("/verify-email", views.verify_email_view, methods=["GET"])
-router.add_api_route("/get-user-details", views.get_user_details_view, methods=["GET"])
+router.add_api_route(
+    "/register",
+    views.register_view,
+    methods=["POST"],
+    response_model=ResponseSchema[UserResponseSchema],
+    dependencies=[Depends(limit_register)],
+)
+router.add_api_route(
+    "/login",
+    views.login_view,
+    methods=["POST"],
+    response_model=LoginResponseSchema,
+    dependencies=[Depends(limit_login)],
+)
+router.add_api_route(
+    "/refresh", views.refresh_view, methods=["POST"], response_model=LoginResponseSchema
+)
+router.add_api_route(
+    "/logout", views.logout_view, methods=["POST"], response_model=MessageResponseSchema
+)
+router.add_api_route(
+    "/logout-all",
+    views.logout_all_view,
+    methods=["POST"],
+    response_model=MessageResponseSchema,
+)
+router.add_api_route(
+    "/sessions",
+    views.sessions_view,
+    methods=["GET"],
+    response_model=ResponseSchema[SessionListSchema],
+)
+router.add_api_route(
+    "/verify-email",
+    views.verify_email_view,
+    methods=["GET"],
+    response_model=MessageResponseSchema,
+)
+router.add_api_route(
+    "/get-user-details",
+    views.get_user_details_view,
+    methods=["GET"],
+    response_model=ResponseSchema[UserResponseSchema],
+)
+router.add_api_route(
+    "/introspect",
+    views.introspect_view,
+    methods=["POST"],
+    response_model=IntrospectResponseSchema,
+)
+router.add_api_route(
+    "/users/batch",
+    views.users_batch_view,
+    methods=["POST"],
+    response_model=ResponseSchema[UserListSchema],
+)
@@ -1,65 +1,186 @@
+import hmac
 from typing import Annotated
 
-from fastapi import Depends, Query
+from fastapi import Depends, Header, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
 from src.api.accounts.schemas import (
+    IntrospectRequestSchema,
+    IntrospectResponseSchema,
     LoginRequestSchema,
     LoginResponseSchema,
     RefreshRequestSchema,
+    SessionListSchema,
     SignupRequestSchema,
+    UserBatchRequestSchema,
+    UserListSchema,
+    UserResponseSchema,
 )
 from src.api.accounts.services import (
+    get_sessions,
     get_user_details,
+    get_users_details,
+    introspect_tokens,
+    iter_users_details,
     login,
     logout,
+    logout_everywhere,
     refresh_tokens,
     register,
     verify_email,
 )
-from src.utils.schema import MessageResponseSchema, ResponseSchema
+from src.settings import settings
+from src.utils.responses import ORJSONResponse
+from src.utils.schema import CustomException, MessageResponseSchema, ResponseSchema
 
 security = HTTPBearer()
 
 
-async def register_view(data: SignupRequestSchema) -> ResponseSchema:
-    data = await register(email=data.email, password=data.password)
-    return ResponseSchema(success=True, dataSource=data)
+async def internal_client(
+    x_internal_api_key: Annotated[str | None, Header()] = None,
+) -> None:
+    """Only lets through callers presenting the shared internal API key."""
+    if not settings.internal_api_key or not hmac.compare_digest(
+        (x_internal_api_key or "").encode(), settings.internal_api_key.encode()
+    ):
+        raise CustomException(
+            message="A valid internal API key is required.",
+            error="unauthorized_client",
+            error_code=status.HTTP_401_UNAUTHORIZED,
+        )
+
+
+# Views build their response model once and return it as an ORJSONResponse, so
+# FastAPI neither re-validates it nor runs it through jsonable_encoder. The
+# `response_model` of each route in urls.py only documents the schema.
+
+
+async def register_view(
+    data: SignupRequestSchema,
+    idempotency_key: Annotated[str | None, Header()] = None,
+) -> ORJSONResponse:
+    user = await register(
+        email=data.email, password=data.password, idempotency_key=idempotency_key
+    )
+    return ORJSONResponse(
+        ResponseSchema[UserResponseSchema](
+            success=True, dataSource=UserResponseSchema.from_user(user)
+        )
+    )
 
 
-async def login_view(data: LoginRequestSchema) -> LoginResponseSchema:
-    access_token, refresh_token = await login(email=data.email, password=data.password)
-    return LoginResponseSchema(access_token=access_token, refresh_token=refresh_token)
+async def login_view(data: LoginRequestSchema, request: Request) -> ORJSONResponse:
+    access_token, refresh_token = await login(
+        email=data.email,
+        password=data.password,
+        user_agent=request.headers.get("user-agent"),
+        ip_address=request.client.host if request.client else None,
+    )
+    return ORJSONResponse(
+        LoginResponseSchema(access_token=access_token, refresh_token=refresh_token)
+    )
 
 
-async def refresh_view(data: RefreshRequestSchema) -> LoginResponseSchema:
+async def refresh_view(data: RefreshRequestSchema) -> ORJSONResponse:
     access_token, new_refresh_token = await refresh_tokens(data.refresh_token)
-    return LoginResponseSchema(
-        access_token=access_token, refresh_token=new_refresh_token
+    return ORJSONResponse(
+        LoginResponseSchema(access_token=access_token, refresh_token=new_refresh_token)
     )
 
 
 async def logout_view(
     credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
-) -> MessageResponseSchema:
+) -> ORJSONResponse:
     token = credentials.credentials
     await logout(token)
 
-    return MessageResponseSchema(success=True, message="Logged out successfully.")
+    return ORJSONResponse(
+        MessageResponseSchema(success=True, message="Logged out successfully.")
+    )
+
 
+async def logout_all_view(
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
+) -> ORJSONResponse:
+    token = credentials.credentials
+    await logout_everywhere(token)
 
-async def verify_email_view(email: str = Query(...), token: str = Query(...)) -> MessageResponseSchema:
+    return ORJSONResponse(
+        MessageResponseSchema(
+            success=True, message="Logged out of all sessions successfully."
+        )
+    )
+
+
+async def verify_email_view(
+    email: str = Query(...), token: str = Query(...)
+) -> ORJSONResponse:
     is_success = await verify_email(email=email, token=token)
     if not is_success:
-        return MessageResponseSchema(
-            success=False, message="Email verification failed."
+        return ORJSONResponse(
+            MessageResponseSchema(success=False, message="Email verification failed.")
         )
-    return MessageResponseSchema(success=True, message="Email verified successfully.")
+    return ORJSONResponse(
+        MessageResponseSchema(success=True, message="Email verified successfully.")
+    )
 
 
 async def get_user_details_view(
     credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
-) -> ResponseSchema:
+) -> ORJSONResponse:
     token = credentials.credentials
-    user_details = await get_user_details(token)
-    return ResponseSchema(success=True, dataSource=user_details)
+    user = await get_user_details(token)
+    return ORJSONResponse(
+        ResponseSchema[UserResponseSchema](
+            success=True, dataSource=UserResponseSchema.from_user(user)
+        )
+    )
+
+
+async def sessions_view(
+    credentials: Annotated[HTTPAuthorizationCredentials, Depends(security)],
+) -> ORJSONResponse:
+    token = credentials.credentials
+    sessions = await get_sessions(token)
+    return ORJSONResponse(
+        ResponseSchema[SessionListSchema](
+            success=True, dataSource=SessionListSchema(sessions=sessions)
+        )
+    )
+
+
+async def introspect_view(
+    data: IntrospectRequestSchema,
+    _: Annotated[None, Depends(internal_client)],
+) -> ORJSONResponse:
+    results = await introspect_tokens(data.tokens)
+    return ORJSONResponse(IntrospectResponseSchema(results=results))
+
+
+async def users_batch_view(
+    data: UserBatchRequestSchema,
+    request: Request,
+    _: Annotated[None, Depends(internal_client)],
+) -> Response:
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        # One send per page of users, so large batches are not held in memory.
+        async def lines():
+            async for page in iter_users_details(
+                data.ids, settings.user_batch_page_size
+            ):
+                yield "".join(
+                    UserResponseSchema.from_user(user).model_dump_json() + "\n"
+                    for user in page
+                )
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    users = [
+        UserResponseSchema.from_user(user) for user in await get_users_details(data.ids)
+    ]
+    return ORJSONResponse(
+        ResponseSchema[UserListSchema](
+            success=True, dataSource=UserListSchema(users=users)
+        )
+    )
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+
+from src.db.config import database, pool_stats, redis
+from src.externals.outbox import get_outbox_backlog
+from src.settings import settings
+from src.utils.hashing import hashing_pool
+
+logger = logging.getLogger("stdout")
+
+
+class ReadinessProbe:
+    """Decides whether this worker should receive traffic.
+
+    Postgres and Redis are probed with a tight timeout and the results are
+    reused for `cache_seconds`, so a burst of load balancer checks costs the
+    dependencies one round trip per worker. Saturation of the worker's own
+    pools is cheap to read and is evaluated on every call.
+    """
+
+    def __init__(self, timeout: float, cache_seconds: float):
+        self.timeout = timeout
+        self.cache_seconds = cache_seconds
+        self._checks: dict = {}
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _probe(self, name: str, probe) -> dict:
+        started_at = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.timeout):
+                await probe()
+        except Exception as e:
+            logger.error("Readiness probe %s failed: %r", name, e)
+            return {"ok": False, "error": repr(e)}
+        return {"ok": True, "latency_ms": (time.perf_counter() - started_at) * 1000}
+
+    async def _ping_postgres(self) -> None:
+        await database.primary.fetchrow("SELECT 1")
+
+    async def _dependency_checks(self) -> dict:
+        async with self._lock:
+            # Concurrent callers wait for the probe already in flight.
+            if time.monotonic() - self._checked_at < self.cache_seconds:
+                return self._checks
+            postgres, redis_check = await asyncio.gather(
+                self._probe("postgres", self._ping_postgres),
+                self._probe("redis", redis.ping),
+            )
+            self._checks = {"postgres": postgres, "redis": redis_check}
+            self._checked_at = time.monotonic()
+            return self._checks
+
+    async def _outbox_backlog(self) -> dict | None:
+        try:
+            async with asyncio.timeout(self.timeout):
+                return await get_outbox_backlog()
+        except Exception as e:
+            logger.error("Error reading outbox backlog: %r", e)
+            return None
+
+    async def check(self) -> tuple[bool, dict]:
+        checks = await self._dependency_checks()
+        failures = [
+            f"{name} unreachable" for name, check in checks.items() if not check["ok"]
+        ]
+
+        pools = pool_stats()
+        max_utilization = settings.readiness_max_pool_utilization
+        for name, stats in pools.items():
+            stats["utilization"] = (
+                stats["in_use"] / stats["max"] if stats["max"] else 0.0
+            )
+            # Replica pools are skipped; reads fall back to the primary.
+            if name.startswith("postgres_replica_") or max_utilization is None:
+                continue
+            if stats["utilization"] >= max_utilization:
+                failures.append(f"{name} pool saturated")
+
+        hashing = hashing_pool.stats()
+        max_queue = settings.readiness_max_hashing_queue_utilization
+        queue_limit = None if max_queue is None else max_queue * hashing["queue_size"]
+        if queue_limit is not None and hashing["queue_depth"] >= queue_limit:
+            failures.append("hashing queue saturated")
+
+        outbox = await self._outbox_backlog()
+        max_backlog = settings.readiness_max_outbox_backlog
+        if outbox is not None and max_backlog is not None:
+            if outbox["queued"] + outbox["retrying"] >= max_backlog:
+                failures.append("email outbox backlog")
+
+        report = {
+            "status": "not_ready" if failures else "ready",
+            "failures": failures,
+            "checks": {
+                **checks,
+                **{
+                    name: {"ok": healthy}
+                    for name, healthy in database.replica_health().items()
+                },
+            },
+            "pools": pools,
+            "hashing": {
+                "queue_depth": hashing["queue_depth"],
+                "queue_size": hashing["queue_size"],
+                "in_flight": hashing["in_flight"],
+            },
+            "outbox": outbox,
+        }
+        return not failures, report
+
+
+readiness_probe = ReadinessProbe(
+    timeout=settings.readiness_probe_timeout_seconds,
+    cache_seconds=settings.readiness_cache_seconds,
+)
@@ -6,3 +6,12 @@ router = APIRouter()
 
 router.add_api_route("/", views.welcome, methods=["GET"])
 router.add_api_route("/health", views.health_check, methods=["GET"])
+router.add_api_route("/ready", views.readiness_check, methods=["GET"])
+router.add_api_route("/stats", views.stats, methods=["GET"])
+
+# Mounted at the site root, where Prometheus scrapes by default
+metrics_router = APIRouter()
+
+metrics_router.add_api_route(
+    "/metrics", views.metrics, methods=["GET"], include_in_schema=False
+)
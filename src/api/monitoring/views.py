@@ -1,5 +1,15 @@
-from fastapi import status
-from fastapi.responses import JSONResponse
+from typing import Annotated
+
+from fastapi import Depends, status
+from fastapi.responses import Response
+
+from src.api.accounts.utils import token_cache
+from src.api.accounts.views import internal_client
+from src.api.monitoring.services import readiness_probe
+from src.db.user_cache import local_cache as user_cache
+from src.utils.hashing import hashing_pool
+from src.utils.metrics import render_metrics
+from src.utils.responses import ORJSONResponse
 
 
 async def welcome():
@@ -8,8 +18,35 @@ async def welcome():
 
 
 async def health_check():
-    """Health check endpoint to verify the service is running."""
-    return JSONResponse(
+    """Liveness check: the worker is up and serving requests."""
+    return ORJSONResponse(
         status_code=status.HTTP_200_OK,
         content={"status": "healthy", "message": "Authentication service is running"},
     )
+
+
+async def readiness_check():
+    """Readiness check: dependencies reachable and pools below saturation."""
+    is_ready, report = await readiness_probe.check()
+    return ORJSONResponse(
+        status_code=(
+            status.HTTP_200_OK if is_ready else status.HTTP_503_SERVICE_UNAVAILABLE
+        ),
+        content=report,
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+async def stats(_: Annotated[None, Depends(internal_client)]):
+    """Runtime statistics for this worker's internal pools."""
+    return {
+        "hashing": hashing_pool.stats(),
+        "token_cache": token_cache.stats(),
+        "user_cache": user_cache.stats(),
+    }
+
+
+async def metrics():
+    """Prometheus metrics aggregated across all workers."""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
@@ -1,9 +1,17 @@
 from fastapi import APIRouter
 
 from src.api.accounts.urls import router as accounts_router
+from src.api.monitoring.urls import metrics_router
 from src.api.monitoring.urls import router as monitoring_router
+from src.api.well_known.urls import router as well_known_router
 
 api_router = APIRouter(prefix="/api")
 
 api_router.include_router(monitoring_router, tags=["Monitoring"])
 api_router.include_router(accounts_router, prefix="/accounts", tags=["Accounts"])
+
+# Served from the site root so token consumers find it at the standard location
+root_router = APIRouter()
+
+root_router.include_router(well_known_router, prefix="/.well-known", tags=["Keys"])
+root_router.include_router(metrics_router)
@@ -0,0 +1,7 @@
+from fastapi import APIRouter
+
+from src.api.well_known import views
+
+router = APIRouter()
+
+router.add_api_route("/jwks.json", views.jwks, methods=["GET"])
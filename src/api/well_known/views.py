@@ -0,0 +1,21 @@
+from fastapi import Request, status
+from fastapi.responses import Response
+
+from src.api.accounts.keys import key_manager
+from src.settings import settings
+
+
+async def jwks(request: Request) -> Response:
+    """Public keys for verifying tokens issued by this service (RFC 7517)."""
+    headers = {
+        "Cache-Control": f"public, max-age={settings.jwks_max_age_seconds}",
+        "ETag": key_manager.jwks_etag,
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    etags = {etag.strip().removeprefix("W/") for etag in if_none_match.split(",")}
+    if key_manager.jwks_etag in etags or "*" in etags:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return Response(
+        content=key_manager.jwks_body, media_type="application/json", headers=headers
+    )
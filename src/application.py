@@ -1,16 +1,32 @@
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
 
-from src.api.router import api_router
-from src.db.config import database, redis
+from src.api.router import api_router, root_router
+from src.db import user_cache
+from src.db.config import database, pool_stats, redis, redis_pool
+from src.utils.breached_passwords import breached_password_filter
+from src.utils.hashing import hashing_pool
+from src.utils.log import RequestIdMiddleware, configure_logging
+from src.utils.metrics import (
+    POOL_CONNECTIONS_IN_USE,
+    POOL_CONNECTIONS_MAX,
+    MetricsMiddleware,
+)
+from src.utils.responses import ORJSONResponse
 from src.utils.schema import CustomException
+from src.utils.tracing import TracingMiddleware, span_exporter
 
 
 def get_app() -> FastAPI:
-    app = FastAPI(title="My Application", version="1.0.0", lifespan=lifespan)
+    configure_logging()
+    app = FastAPI(
+        title="My Application",
+        version="1.0.0",
+        lifespan=lifespan,
+        default_response_class=ORJSONResponse,
+    )
 
     # CORS middleware configuration
     app.add_middleware(
@@ -20,16 +36,28 @@ def get_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    app.add_middleware(MetricsMiddleware, sample_pools=sample_pool_metrics)
+    app.add_middleware(TracingMiddleware)
+    app.add_middleware(RequestIdMiddleware)
 
     @app.exception_handler(CustomException)
     async def custom_exception_handler(request: Request, exc: CustomException):
-        return JSONResponse(status_code=exc.status_code, content=exc.detail)
+        return ORJSONResponse(
+            status_code=exc.status_code, content=exc.detail, headers=exc.headers
+        )
 
     app.include_router(api_router)
+    app.include_router(root_router)
 
     return app
 
 
+def sample_pool_metrics() -> None:
+    for pool, stats in pool_stats().items():
+        POOL_CONNECTIONS_IN_USE.labels(pool).set(stats["in_use"])
+        POOL_CONNECTIONS_MAX.labels(pool).set(stats["max"])
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     import asyncio
@@ -47,11 +75,25 @@ async def lifespan(app: FastAPI):
 
     # Ensure Redis connection
     try:
-        redis.ping()
+        await redis.ping()
     except Exception as e:
         raise RuntimeError(f"Failed to connect to Redis: {e}") from e
 
+    hashing_pool.start()
+    breached_password_filter.open()
+    span_exporter.start()
+    invalidation_listener = asyncio.create_task(user_cache.listen_for_invalidations())
+    replica_monitor = asyncio.create_task(database.monitor_replicas())
+
     yield
 
+    for task in (invalidation_listener, replica_monitor):
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    await span_exporter.shutdown()
+    await hashing_pool.shutdown()
+    breached_password_filter.close()
     await database.disconnect()
-    redis.close()
+    await redis.aclose()
+    await redis_pool.aclose()
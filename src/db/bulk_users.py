@@ -0,0 +1,465 @@
+"""Bulk import and export of users, e.g. to move a tenant from another
+identity provider without registering its users one at a time.
+
+`import_users` streams CSV or NDJSON rows with `email` and `password_hash`,
+and optionally `is_verified` and `created_at`, into `users`. Valid rows are
+copied in batches into a temporary table with `COPY` and inserted from there
+in the same transaction, since `COPY` itself cannot skip or update existing
+emails. After each committed batch the input offset is saved to a checkpoint
+file, and a rerun resumes from it. A batch committed just before a crash,
+whose checkpoint was not saved, is imported again and its rows are skipped
+as existing.
+
+Passwords are imported as hashes, in any format `src.utils.hashing` can
+verify: argon2 and bcrypt. A hash made with other parameters or with bcrypt
+is replaced with a current argon2id hash at the user's next login.
+
+`export_users` streams the table out in id order, CSV through
+`COPY ... TO STDOUT` and NDJSON through a server-side cursor, so memory use
+stays flat however many users there are.
+"""
+
+import csv
+import json
+import os
+import re
+import sys
+import time
+from collections.abc import Iterator
+from datetime import UTC, datetime
+from functools import lru_cache
+from pathlib import Path
+
+import asyncpg
+import orjson
+from email_validator import EmailNotValidError, validate_email
+
+from src.db import user_cache
+from src.utils.hashing import password_hash
+
+FORMATS = ("csv", "ndjson")
+_SUFFIX_FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+_IMPORT_COLUMNS = ("email", "password_hash", "is_verified", "created_at")
+_MAX_LENGTH = 255
+_TRUE = frozenset({"true", "t", "1", "yes", "y"})
+_FALSE = frozenset({"false", "f", "0", "no", "n", ""})
+# Unquoted ASCII local parts, which email_validator returns unchanged.
+_PLAIN_LOCAL_PART = re.compile(
+    r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*"
+)
+
+# Emptied by every commit, so each batch starts with an empty table.
+CREATE_STAGING_TABLE_QUERY = """
+    CREATE TEMPORARY TABLE users_import (
+        email VARCHAR(255) NOT NULL,
+        password_hash VARCHAR(255) NOT NULL,
+        is_verified BOOLEAN NOT NULL,
+        created_at TIMESTAMP
+    ) ON COMMIT DELETE ROWS
+"""
+
+# DISTINCT ON keeps one row of an email repeated within a batch, and sorting
+# by email makes concurrent imports lock existing rows in the same order.
+_INSERT_FROM_STAGING_QUERY = """
+    INSERT INTO users (email, password_hash, is_verified, created_at, updated_at)
+    SELECT DISTINCT ON (email)
+        email, password_hash, is_verified, COALESCE(created_at, NOW()), NOW()
+    FROM users_import
+    ORDER BY email
+    ON CONFLICT (email) DO {action}
+    RETURNING id, email, xmax = 0 AS inserted
+"""
+INSERT_SKIPPING_EXISTING_QUERY = _INSERT_FROM_STAGING_QUERY.format(action="NOTHING")
+INSERT_UPDATING_EXISTING_QUERY = _INSERT_FROM_STAGING_QUERY.format(
+    action="""UPDATE SET
+        password_hash = EXCLUDED.password_hash,
+        is_verified = EXCLUDED.is_verified,
+        updated_at = NOW()"""
+)
+
+
+def _export_query(include_password_hashes: bool) -> str:
+    columns = "id, email, password_hash" if include_password_hashes else "id, email"
+    return f"""
+        SELECT {columns}, is_verified, created_at, updated_at
+        FROM users
+        WHERE id > $1
+        ORDER BY id
+    """
+
+
+def detect_format(path: str) -> str:
+    try:
+        return _SUFFIX_FORMATS[Path(path).suffix.lower()]
+    except KeyError:
+        raise ValueError(
+            f"Cannot tell the format of {path} from its suffix; pass --format."
+        ) from None
+
+
+class Progress:
+    """Row counts of one import or export, reported at most every `interval`."""
+
+    def __init__(self, action: str, interval: float):
+        self.action = action
+        self.interval = interval
+        self.rows = 0
+        self.imported = 0
+        self.updated = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.started_at = time.perf_counter()
+        self._reported_at = self.started_at
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = time.perf_counter() - self.started_at
+        return self.rows / elapsed if elapsed else 0.0
+
+    def summary(self) -> str:
+        counts = [f"{self.rows} rows {self.action}"]
+        if self.action == "read":
+            counts += [
+                f"{self.imported} imported",
+                f"{self.updated} updated",
+                f"{self.skipped} skipped as existing or repeated",
+                f"{self.rejected} rejected",
+            ]
+        elapsed = time.perf_counter() - self.started_at
+        return (
+            f"{', '.join(counts)} in {elapsed:.1f} s "
+            f"({self.rows_per_second:,.0f} rows/s)"
+        )
+
+    def report(self, force: bool = False) -> None:
+        now = time.perf_counter()
+        if force or now - self._reported_at >= self.interval:
+            self._reported_at = now
+            # stderr, so an export to stdout stays clean.
+            print(self.summary(), file=sys.stderr, flush=True)
+
+
+class _Lines:
+    """Decoded lines of a binary file and the byte offset after the last one."""
+
+    def __init__(self, file, offset: int = 0, line: int = 0):
+        file.seek(offset)
+        self.file = file
+        self.offset = offset
+        self.line = line
+
+    def __iter__(self) -> "_Lines":
+        return self
+
+    def __next__(self) -> str:
+        raw = self.file.readline()
+        if not raw:
+            raise StopIteration
+        encoding = "utf-8-sig" if self.offset == 0 else "utf-8"
+        self.offset += len(raw)
+        self.line += 1
+        # Mangled characters make the row fail validation instead of the import.
+        return raw.decode(encoding, "replace")
+
+
+def _read_rows(
+    file, fmt: str, offset: int, line: int
+) -> Iterator[tuple[_Lines, dict | str]]:
+    """Yield (lines, fields) per row, or an error message instead of fields.
+
+    `lines.offset` is where the row ends in the file, `lines.line` its last
+    line number.
+    """
+    if fmt == "csv":
+        lines = _Lines(file)
+        header = next(csv.reader(lines), None)
+        if not header:
+            raise ValueError("The CSV file has no header row.")
+        header = [name.strip().lower() for name in header]
+        if offset > lines.offset:
+            lines = _Lines(file, offset, line)
+        # One reader over all lines, so quoted fields may span lines.
+        for values in csv.reader(lines):
+            if not values:
+                continue
+            if len(values) != len(header):
+                yield lines, f"expected {len(header)} columns, got {len(values)}"
+            else:
+                yield lines, dict(zip(header, values, strict=True))
+        return
+
+    lines = _Lines(file, offset, line)
+    for text in lines:
+        if not text.strip():
+            continue
+        try:
+            fields = orjson.loads(text)
+        except orjson.JSONDecodeError as e:
+            yield lines, f"invalid JSON: {e}"
+            continue
+        if isinstance(fields, dict):
+            yield lines, fields
+        else:
+            yield lines, "expected a JSON object"
+
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, bool) or value is None:
+        return bool(value)
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError(f"is_verified is not a boolean: {value!r}")
+
+
+def _parse_timestamp(value) -> datetime | None:
+    if value is None or value == "":
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(
+            f"created_at is not an ISO 8601 timestamp: {value!r}"
+        ) from None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(UTC).replace(tzinfo=None)
+    return parsed
+
+
+@lru_cache(maxsize=65536)
+def _normalized_domain(domain: str) -> str | None:
+    try:
+        validated = validate_email(f"user@{domain}", check_deliverability=False)
+    except EmailNotValidError:
+        return None
+    return validated.domain if validated.ascii_domain == validated.domain else None
+
+
+def normalize_email(email: str) -> str:
+    """The address as registration would store it, or raise ValueError.
+
+    Checking the domain is most of the cost of validating an address, and an
+    imported tenant's users share a few domains, so plain addresses reuse the
+    result for their domain. Anything else is validated whole.
+    """
+    local_part, _, domain = email.rpartition("@")
+    if len(local_part) <= 64 and _PLAIN_LOCAL_PART.fullmatch(local_part):
+        normalized_domain = _normalized_domain(domain)
+        if normalized_domain is not None:
+            normalized = f"{local_part}@{normalized_domain}"
+            if len(normalized) <= 254:
+                return normalized
+    try:
+        return validate_email(email, check_deliverability=False).normalized
+    except EmailNotValidError as e:
+        raise ValueError(f"invalid email: {e}") from None
+
+
+def to_record(fields: dict) -> tuple:
+    """Validate one input row into a `users_import` record, or raise ValueError."""
+    email = fields.get("email")
+    if not isinstance(email, str) or not email.strip():
+        raise ValueError("email is missing")
+    # Normalised the way registration normalises it, so logins find it.
+    email = normalize_email(email.strip())
+    if len(email) > _MAX_LENGTH:
+        raise ValueError(f"email is longer than {_MAX_LENGTH} characters")
+
+    hashed = fields.get("password_hash")
+    if not isinstance(hashed, str) or not hashed:
+        raise ValueError("password_hash is missing")
+    if len(hashed) > _MAX_LENGTH or not any(
+        hasher.identify(hashed) for hasher in password_hash.hashers
+    ):
+        raise ValueError("password_hash is not an argon2 or bcrypt hash")
+
+    return (
+        email,
+        hashed,
+        _parse_bool(fields.get("is_verified")),
+        _parse_timestamp(fields.get("created_at")),
+    )
+
+
+class Checkpoint:
+    """Progress of an import through its input file, saved after each batch."""
+
+    def __init__(self, path: str, source: str):
+        self.path = Path(path)
+        self.source = str(Path(source).resolve())
+        self.offset = 0
+        self.line = 0
+        self.counts = {"imported": 0, "updated": 0, "skipped": 0, "rejected": 0}
+        self.done = False
+
+    def load(self) -> bool:
+        """Resume from the saved checkpoint, if there is one for this source."""
+        if not self.path.exists():
+            return False
+        saved = json.loads(self.path.read_text())
+        if saved["source"] != self.source:
+            raise ValueError(
+                f"{self.path} is the checkpoint of {saved['source']}, "
+                f"not {self.source}."
+            )
+        self.offset = saved["offset"]
+        self.line = saved["line"]
+        self.counts = saved["counts"]
+        self.done = saved["done"]
+        return True
+
+    def save(self) -> None:
+        # Written to a temporary file and renamed, so a crash leaves either the
+        # previous checkpoint or this one.
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        temporary.write_text(
+            json.dumps(
+                {
+                    "source": self.source,
+                    "offset": self.offset,
+                    "line": self.line,
+                    "counts": self.counts,
+                    "done": self.done,
+                }
+            )
+        )
+        os.replace(temporary, self.path)
+
+
+async def _import_batch(
+    connection: asyncpg.Connection,
+    records: list[tuple],
+    update_existing: bool,
+    progress: Progress,
+) -> None:
+    async with connection.transaction():
+        await connection.copy_records_to_table(
+            "users_import", records=records, columns=_IMPORT_COLUMNS
+        )
+        written = await connection.fetch(
+            INSERT_UPDATING_EXISTING_QUERY
+            if update_existing
+            else INSERT_SKIPPING_EXISTING_QUERY
+        )
+
+    inserted = sum(1 for row in written if row["inserted"])
+    progress.imported += inserted
+    progress.updated += len(written) - inserted
+    progress.skipped += len(records) - len(written)
+    if update_existing:
+        # Raises if Redis fails, before the checkpoint moves past the batch,
+        # so that running the import again rewrites and invalidates it.
+        await user_cache.invalidate_users(
+            [(row["id"], row["email"]) for row in written if not row["inserted"]]
+        )
+
+
+async def import_users(
+    connection: asyncpg.Connection,
+    source: str,
+    fmt: str,
+    checkpoint: Checkpoint,
+    rejects_path: str,
+    batch_size: int,
+    update_existing: bool,
+    progress: Progress,
+) -> None:
+    """Import `source` from the checkpoint on, saving it after every batch."""
+    progress.imported = checkpoint.counts["imported"]
+    progress.updated = checkpoint.counts["updated"]
+    progress.skipped = checkpoint.counts["skipped"]
+    progress.rejected = checkpoint.counts["rejected"]
+    if checkpoint.done:
+        return
+
+    await connection.execute(CREATE_STAGING_TABLE_QUERY)
+
+    async def commit(records: list[tuple], lines: _Lines | None) -> None:
+        if records:
+            await _import_batch(connection, records, update_existing, progress)
+        if lines is not None:
+            checkpoint.offset = lines.offset
+            checkpoint.line = lines.line
+        checkpoint.counts = {
+            "imported": progress.imported,
+            "updated": progress.updated,
+            "skipped": progress.skipped,
+            "rejected": progress.rejected,
+        }
+        checkpoint.save()
+        progress.report()
+
+    records: list[tuple] = []
+    lines = None
+    with open(source, "rb") as file, open(rejects_path, "ab") as rejects:
+        for lines, fields in _read_rows(file, fmt, checkpoint.offset, checkpoint.line):
+            progress.rows += 1
+            try:
+                if isinstance(fields, str):
+                    raise ValueError(fields)
+                records.append(to_record(fields))
+            except ValueError as e:
+                progress.rejected += 1
+                rejects.write(
+                    orjson.dumps(
+                        {
+                            "line": lines.line,
+                            "email": fields.get("email")
+                            if isinstance(fields, dict)
+                            else None,
+                            "error": str(e),
+                        }
+                    )
+                    + b"\n"
+                )
+                continue
+            if len(records) >= batch_size:
+                rejects.flush()
+                await commit(records, lines)
+                records = []
+
+        rejects.flush()
+        checkpoint.done = True
+        await commit(records, lines)
+
+
+async def export_users(
+    connection: asyncpg.Connection,
+    output,
+    fmt: str,
+    include_password_hashes: bool,
+    after_id: int,
+    batch_size: int,
+    progress: Progress,
+) -> None:
+    """Write users with ids above `after_id` to the binary file `output`."""
+    query = _export_query(include_password_hashes)
+
+    if fmt == "csv":
+
+        async def write(chunk: bytes) -> None:
+            output.write(chunk)
+            # Emails and hashes have no line breaks, so lines are rows.
+            progress.rows += chunk.count(b"\n")
+            progress.report()
+
+        await connection.copy_from_query(
+            query, after_id, output=write, format="csv", header=True
+        )
+        # The header line.
+        progress.rows -= 1
+        return
+
+    buffer = bytearray()
+    async with connection.transaction():
+        async for record in connection.cursor(query, after_id, prefetch=batch_size):
+            buffer += orjson.dumps(dict(record.items()))
+            buffer += b"\n"
+            progress.rows += 1
+            if progress.rows % batch_size == 0:
+                output.write(buffer)
+                buffer.clear()
+                progress.report()
+    output.write(buffer)
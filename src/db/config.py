@@ -1,16 +1,306 @@
-import redis
-from databases import Database
+import asyncio
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+import asyncpg
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.asyncio.client import Pipeline
 
 from src.settings import settings
+from src.utils.metrics import REDIS_COMMAND_DURATION
+from src.utils.tracing import span
 
-# PostgreSQL Database connection
-database = Database(str(settings.database_url))
+logger = logging.getLogger("stdout")
 
-# Redis connection
-redis = redis.Redis(
+_CONNECTION_ERRORS = (
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    OSError,
+    asyncio.TimeoutError,
+)
+
+# Set once the current request has written, so its later reads see the write.
+_read_from_primary: ContextVar[bool] = ContextVar("read_from_primary", default=False)
+
+
+def reads_from_primary() -> bool:
+    """Whether the current request has written, so its reads go to the primary."""
+    return _read_from_primary.get()
+
+
+class PostgresPool:
+    """asyncpg connection pool, connected and closed by the application lifespan.
+
+    Queries go through each connection's statement cache, so every fixed query
+    string is prepared on the server once per connection and then reused.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int,
+        max_size: int,
+        statement_cache_size: int,
+        command_timeout: float,
+        pre_ping: bool,
+    ):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_cache_size = statement_cache_size
+        self.command_timeout = command_timeout
+        self.pre_ping = pre_ping
+        self.pool: asyncpg.Pool | None = None
+
+    @property
+    def is_connected(self) -> bool:
+        return self.pool is not None
+
+    async def connect(self) -> None:
+        self.pool = await asyncpg.create_pool(
+            self.dsn,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            statement_cache_size=self.statement_cache_size,
+            command_timeout=self.command_timeout,
+        )
+
+    async def disconnect(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    @asynccontextmanager
+    async def acquire(self):
+        connection = await self.pool.acquire()
+        if self.pre_ping:
+            try:
+                await connection.execute("SELECT 1")
+            except _CONNECTION_ERRORS:
+                # Replace a connection the server has dropped while it sat idle.
+                connection.terminate()
+                await self.pool.release(connection)
+                connection = await self.pool.acquire()
+            except BaseException:
+                # Anything else, e.g. cancellation mid-ping, leaves the
+                # connection in an unknown state: drop it, don't leak it.
+                connection.terminate()
+                await self.pool.release(connection)
+                raise
+        try:
+            yield connection
+        finally:
+            await self.pool.release(connection)
+
+    async def fetchrow(self, query: str, *args) -> asyncpg.Record | None:
+        async with self.acquire() as connection:
+            return await connection.fetchrow(query, *args)
+
+    async def fetch(self, query: str, *args) -> list[asyncpg.Record]:
+        async with self.acquire() as connection:
+            return await connection.fetch(query, *args)
+
+    def stats(self) -> dict:
+        if self.pool is None:
+            return {"in_use": 0, "idle": 0, "max": self.max_size}
+        idle = self.pool.get_idle_size()
+        return {
+            "in_use": self.pool.get_size() - idle,
+            "idle": idle,
+            "max": self.pool.get_max_size(),
+        }
+
+
+# Redis connection pool, opened lazily and closed by the application lifespan
+redis_pool = BlockingConnectionPool(
     host=settings.redis_host,
     port=settings.redis_port,
     db=settings.redis_db,
     password=settings.redis_password,
+    max_connections=settings.redis_max_connections,
+    timeout=settings.redis_pool_timeout,
+    socket_timeout=settings.redis_socket_timeout,
+    socket_connect_timeout=settings.redis_socket_timeout,
     decode_responses=True,
 )
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        with (
+            REDIS_COMMAND_DURATION.labels("pipeline").time(),
+            span("redis", "pipeline", commands=len(self.command_stack)),
+        ):
+            return await super().execute(raise_on_error=raise_on_error)
+
+
+class InstrumentedRedis(Redis):
+    """Redis client that times and traces every command and pipeline."""
+
+    async def execute_command(self, *args, **options):
+        command = str(args[0]).lower()
+        with REDIS_COMMAND_DURATION.labels(command).time(), span("redis", command):
+            return await super().execute_command(*args, **options)
+
+    def pipeline(
+        self, transaction: bool = True, shard_hint: str | None = None
+    ) -> Pipeline:
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+# Redis connection
+redis = InstrumentedRedis(connection_pool=redis_pool)
+
+
+class DatabaseRouter:
+    """Sends writes to the primary and spreads reads across healthy replicas.
+
+    A request that has written reads from the primary for the rest of the
+    request. Writes may also pin keys (e.g. a user's email) to the primary
+    for `sticky_seconds` through Redis, so that a follow-up request, on any
+    worker, reads its own write despite replication lag. Replicas are
+    health-checked in the background and skipped while failing.
+    """
+
+    def __init__(
+        self,
+        primary: PostgresPool,
+        replicas: list[PostgresPool],
+        health_check_interval: float,
+        sticky_seconds: int,
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.health_check_interval = health_check_interval
+        self.sticky_seconds = sticky_seconds
+        self._healthy = dict.fromkeys(replicas, False)
+        self._round_robin = itertools.cycle(replicas)
+
+    @property
+    def is_connected(self) -> bool:
+        return self.primary.is_connected
+
+    async def connect(self) -> None:
+        await self.primary.connect()
+        for replica in self.replicas:
+            try:
+                await replica.connect()
+                self._healthy[replica] = True
+            except Exception as e:
+                logger.error("Error connecting to database replica: %s", e)
+
+    async def disconnect(self) -> None:
+        await self.primary.disconnect()
+        for replica in self.replicas:
+            await replica.disconnect()
+
+    async def monitor_replicas(self) -> None:
+        """Re-check replica health for the lifetime of the worker."""
+        while self.replicas:
+            await asyncio.sleep(self.health_check_interval)
+            for replica in self.replicas:
+                try:
+                    if not replica.is_connected:
+                        await replica.connect()
+                    async with asyncio.timeout(self.health_check_interval):
+                        await replica.fetchrow("SELECT 1")
+                    self._healthy[replica] = True
+                except Exception as e:
+                    if self._healthy[replica]:
+                        logger.error("Database replica marked unhealthy: %s", e)
+                    self._healthy[replica] = False
+
+    def replica_health(self) -> dict[str, bool]:
+        return {
+            f"postgres_replica_{index}": self._healthy[replica]
+            for index, replica in enumerate(self.replicas)
+        }
+
+    async def _is_pinned(self, sticky_key: str | None) -> bool:
+        if _read_from_primary.get():
+            return True
+        if sticky_key is None:
+            return False
+        try:
+            return bool(await redis.exists(f"db_primary_pin:{sticky_key}"))
+        except Exception:
+            return True
+
+    async def _pick_replica(self, sticky_key: str | None) -> PostgresPool | None:
+        if not any(self._healthy.values()) or await self._is_pinned(sticky_key):
+            return None
+        for _ in self.replicas:
+            replica = next(self._round_robin)
+            if self._healthy[replica]:
+                return replica
+        return None
+
+    async def _read(self, method: str, query: str, args: tuple, sticky_key: str | None):
+        replica = await self._pick_replica(sticky_key)
+        if replica is not None:
+            try:
+                return await getattr(replica, method)(query, *args)
+            except _CONNECTION_ERRORS as e:
+                logger.error("Database replica failed, reading from primary: %s", e)
+                self._healthy[replica] = False
+        return await getattr(self.primary, method)(query, *args)
+
+    async def fetchrow_read(
+        self, query: str, *args, sticky_key: str | None = None
+    ) -> asyncpg.Record | None:
+        return await self._read("fetchrow", query, args, sticky_key)
+
+    async def fetch_read(self, query: str, *args) -> list[asyncpg.Record]:
+        return await self._read("fetch", query, args, None)
+
+    async def fetchrow_write(self, query: str, *args) -> asyncpg.Record | None:
+        _read_from_primary.set(True)
+        return await self.primary.fetchrow(query, *args)
+
+    async def pin_to_primary(self, *sticky_keys: str) -> None:
+        """Route reads of these keys to the primary until replicas catch up."""
+        if not self.replicas:
+            return
+        async with redis.pipeline(transaction=False) as pipe:
+            for sticky_key in sticky_keys:
+                pipe.set(f"db_primary_pin:{sticky_key}", "1", ex=self.sticky_seconds)
+            await pipe.execute()
+
+
+def _create_pool(dsn: str) -> PostgresPool:
+    return PostgresPool(
+        dsn,
+        min_size=settings.db_pool_min_size,
+        max_size=settings.db_pool_max_size,
+        statement_cache_size=settings.db_statement_cache_size,
+        command_timeout=settings.db_command_timeout,
+        pre_ping=settings.db_pool_pre_ping,
+    )
+
+
+# PostgreSQL Database connections
+database = DatabaseRouter(
+    primary=_create_pool(str(settings.database_url)),
+    replicas=[_create_pool(url) for url in settings.database_replica_urls],
+    health_check_interval=settings.db_replica_health_check_interval,
+    sticky_seconds=settings.db_replica_sticky_seconds,
+)
+
+
+def pool_stats() -> dict:
+    """Usage of every connection pool owned by this worker."""
+    stats = {
+        "postgres_primary": database.primary.stats(),
+        "redis": {
+            "in_use": len(redis_pool._in_use_connections),
+            "idle": len(redis_pool._available_connections),
+            "max": redis_pool.max_connections,
+        },
+    }
+    for index, replica in enumerate(database.replicas):
+        stats[f"postgres_replica_{index}"] = replica.stats()
+    return stats
@@ -1,8 +1,17 @@
 from datetime import datetime
+from functools import lru_cache
 
+import asyncpg
 from pydantic import BaseModel
 
-from src.db.config import database
+from src.db import user_cache
+from src.db.config import database, reads_from_primary
+from src.utils.metrics import DB_QUERY_DURATION
+from src.utils.single_flight import SingleFlight
+from src.utils.tracing import span
+
+# Columns callers may change through update_user_by_id/update_user_by_email.
+UPDATABLE_COLUMNS = frozenset({"password_hash", "is_verified"})
 
 
 class UserSchema(BaseModel):
@@ -14,69 +23,183 @@ class UserSchema(BaseModel):
     updated_at: datetime
 
 
-async def create_user(email: str, password_hash: str) -> UserSchema | None:
-    query = """
-        INSERT INTO users (email, password_hash)
-        VALUES (:email, :password_hash)
+def _to_user(record: asyncpg.Record) -> UserSchema:
+    # Column types already match the schema, so skip validation.
+    return UserSchema.model_construct(**dict(record.items()))
+
+
+CREATE_USER_QUERY = """
+    INSERT INTO users (email, password_hash)
+    VALUES ($1, $2)
+    RETURNING id, email, is_verified, created_at, updated_at
+"""
+
+GET_USER_BY_EMAIL_QUERY = """
+    SELECT id, email, password_hash, is_verified, created_at, updated_at
+    FROM users
+    WHERE email = $1
+"""
+
+GET_USER_BY_ID_QUERY = """
+    SELECT id, email, created_at, updated_at
+    FROM users
+    WHERE id = $1
+"""
+
+GET_USERS_BY_IDS_QUERY = """
+    SELECT id, email, created_at, updated_at
+    FROM users
+    WHERE id = ANY($1::int[])
+"""
+
+
+@lru_cache(maxsize=32)
+def _update_query(columns: tuple[str, ...], key_column: str) -> str:
+    set_clause = ", ".join(
+        f"{column} = ${position}" for position, column in enumerate(columns, start=2)
+    )
+    return f"""
+        UPDATE users
+        SET {set_clause}, updated_at = NOW()
+        WHERE {key_column} = $1
         RETURNING id, email, is_verified, created_at, updated_at
     """
-    user = await database.fetch_one(
-        query=query, values={"email": email, "password_hash": password_hash}
-    )
+
+
+async def _after_write(user: UserSchema) -> None:
+    await database.pin_to_primary(f"user:{user.id}", f"user:{user.email}")
+    await user_cache.invalidate_user(user_id=user.id, email=user.email)
+
+
+async def _update_user(
+    key_column: str, key_value, update_dict: dict
+) -> UserSchema | None:
+    unknown_columns = update_dict.keys() - UPDATABLE_COLUMNS
+    if unknown_columns:
+        raise ValueError(f"Cannot update user columns: {sorted(unknown_columns)}")
+
+    columns = tuple(sorted(update_dict))
+    with (
+        DB_QUERY_DURATION.labels(f"update_user_by_{key_column}").time(),
+        span("db", f"update_user_by_{key_column}"),
+    ):
+        user = await database.fetchrow_write(
+            _update_query(columns, key_column),
+            key_value,
+            *(update_dict[column] for column in columns),
+        )
     if user:
-        return UserSchema(**user)
+        user = _to_user(user)
+        await _after_write(user)
+        return user
     return None
 
 
-async def get_user_by_email(email: str) -> UserSchema | None:
-    query = """
-        SELECT id, email, password_hash, is_verified, created_at, updated_at
-        FROM users
-        WHERE email = :email
-    """
-    user = await database.fetch_one(query=query, values={"email": email})
+async def create_user(email: str, password_hash: str) -> UserSchema | None:
+    with (
+        DB_QUERY_DURATION.labels("create_user").time(),
+        span("db", "create_user"),
+    ):
+        user = await database.fetchrow_write(CREATE_USER_QUERY, email, password_hash)
     if user:
-        return UserSchema(**user)
+        user = _to_user(user)
+        await _after_write(user)
+        return user
     return None
 
 
-async def get_user_by_id(user_id: int) -> UserSchema | None:
-    query = """
-        SELECT id, email, created_at, updated_at
-        FROM users
-        WHERE id = :user_id
+# Concurrent lookups of the same user share one cache read and query. A
+# request that has written only joins lookups that also read the primary.
+user_lookups = SingleFlight("user_lookup")
+
+
+async def get_user_by_email(
+    email: str, with_password_hash: bool = False
+) -> UserSchema | None:
+    """Look a user up by email, with its `password_hash` if asked for.
+
+    Without `with_password_hash`, `password_hash` may or may not be set.
     """
-    user = await database.fetch_one(query=query, values={"user_id": user_id})
+    return await user_lookups.do(
+        ("email", email, with_password_hash, reads_from_primary()),
+        _get_user_by_email,
+        email,
+        with_password_hash,
+    )
+
+
+async def get_user_by_id(user_id: int) -> UserSchema | None:
+    return await user_lookups.do(
+        ("id", user_id, reads_from_primary()), _get_user_by_id, user_id
+    )
+
+
+async def _get_user_by_email(email: str, with_password_hash: bool) -> UserSchema | None:
+    cached_user, fill = await user_cache.get_cached_user("email", email, UserSchema)
+    # Redis entries have no password hash, so logins may still need the row.
+    if cached_user and (cached_user.password_hash or not with_password_hash):
+        return cached_user
+
+    if fill is None:
+        fill = await user_cache.begin_fill("email", email)
+    with (
+        DB_QUERY_DURATION.labels("get_user_by_email").time(),
+        span("db", "get_user_by_email"),
+    ):
+        user = await database.fetchrow_read(
+            GET_USER_BY_EMAIL_QUERY, email, sticky_key=f"user:{email}"
+        )
     if user:
-        return UserSchema(**user)
+        user = _to_user(user)
+        await user_cache.cache_user("email", email, user, fill)
+        return user
     return None
 
 
-async def update_user_by_id(user_id: int, update_dict: dict) -> None:
-    set_clause = ", ".join([f"{key} = :{key}" for key in update_dict.keys()])
-    query = f"""
-        UPDATE users
-        SET {set_clause}, updated_at = NOW()
-        WHERE id = :user_id
-        RETURNING id, email, is_verified, created_at, updated_at
-    """
-    values = {**update_dict, "user_id": user_id}
-    user = await database.fetch_one(query=query, values=values)
+async def _get_user_by_id(user_id: int) -> UserSchema | None:
+    cached_user, fill = await user_cache.get_cached_user("id", user_id, UserSchema)
+    if cached_user:
+        return cached_user
+
+    with (
+        DB_QUERY_DURATION.labels("get_user_by_id").time(),
+        span("db", "get_user_by_id"),
+    ):
+        user = await database.fetchrow_read(
+            GET_USER_BY_ID_QUERY, user_id, sticky_key=f"user:{user_id}"
+        )
     if user:
-        return UserSchema(**user)
+        user = _to_user(user)
+        await user_cache.cache_user("id", user_id, user, fill)
+        return user
     return None
 
 
-async def update_user_by_email(email: str, update_dict: dict) -> None:
-    set_clause = ", ".join([f"{key} = :{key}" for key in update_dict.keys()])
-    query = f"""
-        UPDATE users
-        SET {set_clause}, updated_at = NOW()
-        WHERE email = :email
-        RETURNING id, email, is_verified, created_at, updated_at
+async def get_users_by_ids(user_ids: list[int]) -> list[UserSchema]:
+    """Resolve many users in one round trip, serving cached users first.
+
+    Users are returned in the order of `user_ids`; unknown ids are skipped.
     """
-    values = {**update_dict, "email": email}
-    user = await database.fetch_one(query=query, values=values)
-    if user:
-        return UserSchema(**user)
-    return None
+    user_ids = list(dict.fromkeys(user_ids))
+    users, fills = await user_cache.get_cached_users("id", user_ids, UserSchema)
+
+    missing_ids = [user_id for user_id in user_ids if user_id not in users]
+    if missing_ids:
+        with (
+            DB_QUERY_DURATION.labels("get_users_by_ids").time(),
+            span("db", "get_users_by_ids"),
+        ):
+            records = await database.fetch_read(GET_USERS_BY_IDS_QUERY, missing_ids)
+        fetched_users = {record["id"]: _to_user(record) for record in records}
+        await user_cache.cache_users("id", fetched_users, fills)
+        users.update(fetched_users)
+
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+
+async def update_user_by_id(user_id: int, update_dict: dict) -> UserSchema | None:
+    return await _update_user("id", user_id, update_dict)
+
+
+async def update_user_by_email(email: str, update_dict: dict) -> UserSchema | None:
+    return await _update_user("email", email, update_dict)
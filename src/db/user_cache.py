@@ -0,0 +1,249 @@
+import asyncio
+import json
+import logging
+import time
+
+from src.db.config import redis
+from src.settings import settings
+from src.utils.cache import LRUCache
+
+logger = logging.getLogger("stdout")
+
+INVALIDATION_CHANNEL = "user_cache:invalidate"
+
+# Entries are keyed by the lookup that produced them, e.g. ("email", email),
+# so a cached row only ever holds the columns that lookup selected. Password
+# hashes are only kept in the local tier, which invalidations reach at once.
+local_cache = LRUCache(max_entries=settings.user_cache_local_max_entries)
+_REDIS_EXCLUDE = {"password_hash"}
+
+# A lookup that read a row before an update must not cache it after the
+# update's invalidation. `invalidate_user` bumps a generation per entry in
+# Redis, and this process's eviction count locally; a fill records both
+# before its query and is only stored if neither has changed since.
+_local_evictions = 0
+
+# KEYS[1] = entry key, KEYS[2] = its generation key
+# ARGV[1] = generation read before the query, ARGV[2] = entry, ARGV[3] = TTL
+_FILL = redis.register_script(
+    """
+    if (redis.call('GET', KEYS[2]) or '0') == ARGV[1] then
+        redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+        return 1
+    end
+    return 0
+    """
+)
+
+
+class Fill:
+    """What a lookup saw before querying, to tell if its row is still current."""
+
+    __slots__ = ("local_evictions", "generation")
+
+    def __init__(self, local_evictions: int, generation: str | None):
+        self.local_evictions = local_evictions
+        # None if Redis could not be read, so the row is not stored there.
+        self.generation = generation
+
+
+def _redis_key(lookup: str, value) -> str:
+    return f"user_cache:{lookup}:{value}"
+
+
+def _generation_key(lookup: str, value) -> str:
+    return f"user_cache:generation:{lookup}:{value}"
+
+
+async def begin_fills(lookup: str, values: list) -> dict:
+    """Record a `Fill` per value; call before querying the rows to cache."""
+    local_evictions = _local_evictions
+    if not settings.user_cache_enabled or not values:
+        return {value: Fill(local_evictions, None) for value in values}
+    try:
+        generations = await redis.mget(
+            [_generation_key(lookup, value) for value in values]
+        )
+    except Exception as e:
+        logger.error("Error reading user cache generations: %s", e)
+        return {value: Fill(local_evictions, None) for value in values}
+    return {
+        value: Fill(local_evictions, generation or "0")
+        for value, generation in zip(values, generations, strict=True)
+    }
+
+
+async def begin_fill(lookup: str, value) -> Fill:
+    return (await begin_fills(lookup, [value]))[value]
+
+
+async def get_cached_user(lookup: str, value, schema) -> tuple:
+    """Return a cached user for `lookup`, checking this worker first, then Redis.
+
+    Returns the user, or None and the `Fill` to pass to `cache_user` once the
+    row has been queried. The fill is None for users found in this worker.
+    """
+    users, fills = await get_cached_users(lookup, [value], schema)
+    return users.get(value), fills.get(value)
+
+
+async def get_cached_users(lookup: str, values: list, schema) -> tuple[dict, dict]:
+    """Bulk variant of `get_cached_user`, returning users and fills by value.
+
+    Redis is read with one MGET, which also fetches the generations of the
+    entries, so that a miss can be filled without another round trip.
+    """
+    local_evictions = _local_evictions
+    if not settings.user_cache_enabled:
+        return {}, {value: Fill(local_evictions, None) for value in values}
+
+    users = {}
+    missing = []
+    for value in values:
+        user = local_cache.get((lookup, value))
+        if user is not None:
+            users[value] = user.model_copy()
+        else:
+            missing.append(value)
+    if not missing:
+        return users, {}
+
+    local_evictions = _local_evictions
+    try:
+        cached = await redis.mget(
+            [_redis_key(lookup, value) for value in missing]
+            + [_generation_key(lookup, value) for value in missing]
+        )
+    except Exception as e:
+        logger.error("Error reading user cache: %s", e)
+        return users, {value: Fill(local_evictions, None) for value in missing}
+
+    fills = {}
+    expires_at = time.time() + settings.user_cache_local_ttl_seconds
+    payloads, generations = cached[: len(missing)], cached[len(missing) :]
+    for value, payload, generation in zip(missing, payloads, generations, strict=True):
+        if payload is None:
+            fills[value] = Fill(local_evictions, generation or "0")
+            continue
+        user = schema.model_validate_json(payload)
+        if local_evictions == _local_evictions:
+            local_cache.set((lookup, value), user, expires_at=expires_at)
+        users[value] = user.model_copy()
+    return users, fills
+
+
+async def cache_users(lookup: str, users: dict, fills: dict) -> None:
+    """Bulk variant of `cache_user`, written to Redis in one pipeline."""
+    if not settings.user_cache_enabled or not users:
+        return
+
+    expires_at = time.time() + settings.user_cache_local_ttl_seconds
+    for value, user in users.items():
+        if fills[value].local_evictions == _local_evictions:
+            local_cache.set((lookup, value), user.model_copy(), expires_at=expires_at)
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            for value, user in users.items():
+                await _queue_fill(pipe, lookup, value, user, fills[value])
+            await pipe.execute()
+    except Exception as e:
+        logger.error("Error writing user cache: %s", e)
+
+
+async def cache_user(lookup: str, value, user, fill: Fill) -> None:
+    await cache_users(lookup, {value: user}, {value: fill})
+
+
+async def _queue_fill(pipe, lookup: str, value, user, fill: Fill) -> None:
+    if fill.generation is None:
+        return
+    await _FILL(
+        keys=[_redis_key(lookup, value), _generation_key(lookup, value)],
+        args=[
+            fill.generation,
+            user.model_dump_json(exclude=_REDIS_EXCLUDE),
+            settings.user_cache_redis_ttl_seconds,
+        ],
+        client=pipe,
+    )
+
+
+def _evict_local(user_id: int | None, email: str | None) -> None:
+    global _local_evictions
+    _local_evictions += 1
+    if user_id is not None:
+        local_cache.delete(("id", user_id))
+    if email is not None:
+        local_cache.delete(("email", email))
+
+
+async def invalidate_user(user_id: int | None = None, email: str | None = None) -> None:
+    """Drop a user from every tier and tell the other workers to do the same."""
+    try:
+        await invalidate_users([(user_id, email)])
+    except Exception as e:
+        logger.error("Error invalidating user cache: %s", e)
+
+
+async def invalidate_users(users: list[tuple[int | None, str | None]]) -> None:
+    """`invalidate_user` for many (id, email) pairs, in one Redis pipeline.
+
+    Unlike `invalidate_user`, Redis errors are raised to the caller.
+    """
+    for user_id, email in users:
+        _evict_local(user_id, email)
+    if not settings.user_cache_enabled or not users:
+        return
+
+    entries = []
+    for user_id, email in users:
+        if user_id is not None:
+            entries.append(("id", user_id))
+        if email is not None:
+            entries.append(("email", email))
+    async with redis.pipeline(transaction=False) as pipe:
+        # Bump the generations first, so fills that read the old row
+        # before this point are not stored after the delete.
+        for lookup, value in entries:
+            generation_key = _generation_key(lookup, value)
+            pipe.incr(generation_key)
+            # Long enough to outlast any fill that read the old value.
+            pipe.expire(generation_key, settings.user_cache_redis_ttl_seconds)
+        if entries:
+            pipe.delete(*(_redis_key(lookup, value) for lookup, value in entries))
+        for user_id, email in users:
+            pipe.publish(
+                INVALIDATION_CHANNEL, json.dumps({"id": user_id, "email": email})
+            )
+        await pipe.execute()
+
+
+async def listen_for_invalidations() -> None:
+    """Evict local entries as invalidations arrive from other workers and nodes.
+
+    Runs for the lifetime of the worker. Whenever the subscription has to be
+    re-established the local tier is cleared, since messages may have been
+    missed while disconnected.
+    """
+    while True:
+        pubsub = redis.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            local_cache.clear()
+            while True:
+                # An explicit timeout returns None when the channel is idle;
+                # listen() would hit the pool's socket timeout and reconnect.
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=60.0
+                )
+                if message is None or message["type"] != "message":
+                    continue
+                data = json.loads(message["data"])
+                _evict_local(data.get("id"), data.get("email"))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("User cache invalidation listener failed: %s", e)
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
@@ -0,0 +1,34 @@
+import asyncio
+import signal
+
+from prometheus_client import start_http_server
+
+from src.db.config import redis, redis_pool
+from src.externals.outbox import EmailOutboxWorker
+from src.settings import settings
+from src.utils.log import configure_logging
+
+
+async def run() -> None:
+    worker = EmailOutboxWorker()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    try:
+        await redis.ping()
+        await worker.run()
+    finally:
+        await redis.aclose()
+        await redis_pool.aclose()
+
+
+def main() -> None:
+    configure_logging()
+    if settings.email_worker_metrics_port:
+        start_http_server(settings.email_worker_metrics_port)
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+from redis.exceptions import ResponseError
+
+from src.db.config import redis
+from src.settings import settings
+from src.utils.helpers import render_email, warm_templates
+from src.utils.metrics import EMAIL_SEND_DURATION
+from src.utils.tracing import span
+
+logger = logging.getLogger("stdout")
+
+STREAM_KEY = settings.email_outbox_stream
+RETRY_KEY = f"{STREAM_KEY}:retry"
+CONSUMER_GROUP = "email-workers"
+
+# Moves a due retry back to the stream in one step, so a message is never
+# out of both. Only the worker whose ZREM succeeds re-queues it.
+# KEYS[1] = retry set, KEYS[2] = stream
+# ARGV[1] = the retry payload, ARGV[2..] = its fields as name, value pairs
+_PROMOTE_RETRY = redis.register_script(
+    """
+    if redis.call('ZREM', KEYS[1], ARGV[1]) == 1 then
+        return redis.call('XADD', KEYS[2], '*', unpack(ARGV, 2))
+    end
+    return false
+    """
+)
+
+
+def _status_key(outbox_id: str) -> str:
+    return f"{STREAM_KEY}:status:{outbox_id}"
+
+
+async def enqueue_email(
+    to_email: str, subject: str, template: str, context: dict
+) -> str:
+    """Queue an email for the background sender and return its outbox id."""
+    outbox_id = uuid4().hex
+    fields = {
+        "outbox_id": outbox_id,
+        "to_email": to_email,
+        "subject": subject,
+        "template": template,
+        "context": json.dumps(context),
+        "attempts": "0",
+    }
+    with span("email", "enqueue", template=template):
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.xadd(STREAM_KEY, fields)
+            pipe.hset(
+                _status_key(outbox_id),
+                mapping={
+                    "status": "queued",
+                    "attempts": 0,
+                    "updated_at": int(time.time()),
+                },
+            )
+            pipe.expire(_status_key(outbox_id), settings.email_status_ttl_seconds)
+            await pipe.execute()
+    return outbox_id
+
+
+async def get_outbox_backlog() -> dict:
+    """Messages waiting in the outbox, split by delivery stage."""
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.xlen(STREAM_KEY)
+        pipe.xpending(STREAM_KEY, CONSUMER_GROUP)
+        pipe.zcard(RETRY_KEY)
+        length, pending, retrying = await pipe.execute(raise_on_error=False)
+    # XPENDING fails with NOGROUP until the first worker has started.
+    in_flight = 0 if isinstance(pending, Exception) else pending["pending"]
+    return {
+        "queued": length - in_flight,
+        "in_flight": in_flight,
+        "retrying": retrying,
+    }
+
+
+def get_email_transport():
+    if settings.email_transport == "resend":
+        from src.externals.resend import ResendEmailHandler
+
+        return ResendEmailHandler()
+
+    from src.externals.smtp import SMTPEmailHandler
+
+    return SMTPEmailHandler()
+
+
+class EmailOutboxWorker:
+    """Delivers queued emails from the Redis stream.
+
+    Sends run on a small thread pool where every thread owns one transport, so
+    SMTP connections stay authenticated across messages. Failed sends are
+    parked in a sorted set and re-queued with exponential backoff; messages
+    left pending by a crashed worker are reclaimed after `claim_idle_ms`.
+    """
+
+    def __init__(
+        self,
+        transport_factory=get_email_transport,
+        concurrency: int = settings.email_worker_concurrency,
+        batch_size: int = settings.email_worker_batch_size,
+        claim_idle_ms: int = 60_000,
+    ):
+        self.transport_factory = transport_factory
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.claim_idle_ms = claim_idle_ms
+        self.consumer_name = f"{socket.gethostname()}-{os.getpid()}"
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="email-sender"
+        )
+        self._local = threading.local()
+        self._transports = []
+        self._transports_lock = threading.Lock()
+        self._stopping = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    async def run(self) -> None:
+        warm_templates()
+        await self._ensure_group()
+        last_claim = 0.0
+        try:
+            while not self._stopping.is_set():
+                await self._promote_due_retries()
+                if time.monotonic() - last_claim > self.claim_idle_ms / 1000:
+                    await self._reclaim_stale()
+                    last_claim = time.monotonic()
+
+                response = await redis.xreadgroup(
+                    CONSUMER_GROUP,
+                    self.consumer_name,
+                    {STREAM_KEY: ">"},
+                    count=self.batch_size,
+                    block=1000,
+                )
+                for _, messages in response or []:
+                    await self._deliver_batch(messages)
+        finally:
+            self._executor.shutdown(wait=True)
+            for transport in self._transports:
+                close = getattr(transport, "close", None)
+                if close:
+                    close()
+
+    async def _ensure_group(self) -> None:
+        try:
+            await redis.xgroup_create(STREAM_KEY, CONSUMER_GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _reclaim_stale(self) -> None:
+        _, messages, *_ = await redis.xautoclaim(
+            STREAM_KEY,
+            CONSUMER_GROUP,
+            self.consumer_name,
+            min_idle_time=self.claim_idle_ms,
+            count=self.batch_size,
+        )
+        if messages:
+            await self._deliver_batch(messages)
+
+    async def _promote_due_retries(self) -> None:
+        due = await redis.zrangebyscore(
+            RETRY_KEY, 0, time.time(), start=0, num=self.batch_size
+        )
+        for payload in due:
+            fields = [part for item in json.loads(payload).items() for part in item]
+            await _PROMOTE_RETRY(keys=[RETRY_KEY, STREAM_KEY], args=[payload, *fields])
+
+    async def _deliver_batch(self, messages: list) -> None:
+        await asyncio.gather(
+            *(self._deliver(message_id, fields) for message_id, fields in messages)
+        )
+
+    def _get_transport(self):
+        transport = getattr(self._local, "transport", None)
+        if transport is None:
+            transport = self.transport_factory()
+            self._local.transport = transport
+            with self._transports_lock:
+                self._transports.append(transport)
+        return transport
+
+    def _send(
+        self,
+        to_email: str,
+        subject: str,
+        html_content: str,
+        text_content: str | None,
+    ) -> bool:
+        transport = self._get_transport()
+        started_at = time.perf_counter()
+        is_sent = bool(
+            transport.send_email(to_email, subject, html_content, text_content)
+        )
+        EMAIL_SEND_DURATION.labels(
+            type(transport).__name__, "sent" if is_sent else "failed"
+        ).observe(time.perf_counter() - started_at)
+        return is_sent
+
+    async def _deliver(self, message_id: str, fields: dict) -> None:
+        attempts = int(fields.get("attempts", 0)) + 1
+        error = ""
+        try:
+            html_content, text_content = render_email(
+                fields["template"], json.loads(fields["context"])
+            )
+            loop = asyncio.get_running_loop()
+            is_sent = await loop.run_in_executor(
+                self._executor,
+                self._send,
+                fields["to_email"],
+                fields["subject"],
+                html_content,
+                text_content,
+            )
+        except Exception as e:
+            logger.error("Error delivering outbox message %s: %s", message_id, e)
+            is_sent = False
+            error = str(e)
+
+        if is_sent:
+            delivery_status = "delivered"
+        elif attempts >= settings.email_max_attempts:
+            delivery_status = "failed"
+        else:
+            delivery_status = "retrying"
+
+        status_key = _status_key(fields["outbox_id"])
+        async with redis.pipeline(transaction=True) as pipe:
+            if delivery_status == "retrying":
+                backoff = min(
+                    settings.email_retry_backoff_seconds * 2 ** (attempts - 1),
+                    settings.email_retry_backoff_max_seconds,
+                )
+                retry_fields = {**fields, "attempts": str(attempts)}
+                pipe.zadd(RETRY_KEY, {json.dumps(retry_fields): time.time() + backoff})
+            pipe.xack(STREAM_KEY, CONSUMER_GROUP, message_id)
+            pipe.xdel(STREAM_KEY, message_id)
+            pipe.hset(
+                status_key,
+                mapping={
+                    "status": delivery_status,
+                    "attempts": attempts,
+                    "updated_at": int(time.time()),
+                    "error": error,
+                },
+            )
+            pipe.expire(status_key, settings.email_status_ttl_seconds)
+            await pipe.execute()
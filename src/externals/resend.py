@@ -1,8 +1,11 @@
+import logging
 import os
 
 import resend
 
-from src.utils.helpers import get_html_template, render_html_template
+from src.utils.helpers import render_email
+
+logger = logging.getLogger("stdout")
 
 RESEND_API_KEY = os.getenv("RESEND_API_KEY", "")
 
@@ -13,7 +16,11 @@ class ResendEmailHandler:
         resend.api_key = RESEND_API_KEY
 
     def send_email(
-        self, to_email: str, subject: str, html_content: str
+        self,
+        to_email: str,
+        subject: str,
+        html_content: str,
+        text_content: str | None = None,
     ) -> resend.Email | None:
         try:
             params: resend.Emails.SendParams = {
@@ -22,20 +29,24 @@ class ResendEmailHandler:
                 "subject": subject,
                 "html": html_content,
             }
+            if text_content:
+                params["text"] = text_content
             email: resend.Emails.SendResponse = resend.Emails.send(params)
             return email
         except Exception as e:
-            print(f"Error sending email for {to_email}: {e}")
+            logger.error("Error sending email for %s: %s", to_email, e)
             return None
 
     def send_verification_email(self, to_email: str, verification_link: str) -> bool:
         subject = "Verify Your Email Address"
-        html_template = get_html_template(template_file_name="verification_email.html")
-        if not html_template:
-            print("Error: HTML template for verification email not found.")
+        context = {"verification_link": verification_link}
+        try:
+            html_content, text_content = render_email(
+                "verification_email.html", context
+            )
+        except Exception as e:
+            logger.error("Error rendering verification email: %s", e)
             return False
 
-        context = {"verification_link": verification_link}
-        html_content = render_html_template(html_template, context)
-        email_response = self.send_email(to_email, subject, html_content)
+        email_response = self.send_email(to_email, subject, html_content, text_content)
         return email_response is not None
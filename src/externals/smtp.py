@@ -1,11 +1,12 @@
 import logging
 import os
 import smtplib
+from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
 from dotenv import load_dotenv
 
-from src.utils.helpers import get_html_template, render_html_template
+from src.utils.helpers import render_email
 
 logger = logging.getLogger("stdout")
 
@@ -13,40 +14,88 @@ load_dotenv()
 
 
 class SMTPEmailHandler:
+    """SMTP transport that keeps one authenticated connection open between sends.
+
+    A handler instance is not thread-safe; the email worker gives each of its
+    sender threads its own handler so connections are pooled per thread.
+    """
+
     def __init__(self):
         self.SMTP_EMAIL = os.getenv("SMTP_EMAIL")
         self.SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
         self.SMTP_HOST = os.getenv("SMTP_HOST")
         self.SMTP_PORT = int(os.getenv("SMTP_PORT"))
+        self.SMTP_USE_SSL = os.getenv("SMTP_USE_SSL", "true").lower() == "true"
         if not all(
             [self.SMTP_EMAIL, self.SMTP_PASSWORD, self.SMTP_HOST, self.SMTP_PORT]
         ):
             raise ValueError(
                 "SMTP configuration is incomplete. Please check environment variables."
             )
+        self._server: smtplib.SMTP | None = None
+
+    def _connect(self) -> smtplib.SMTP:
+        if self.SMTP_USE_SSL:
+            server = smtplib.SMTP_SSL(self.SMTP_HOST, self.SMTP_PORT, timeout=30)
+        else:
+            server = smtplib.SMTP(self.SMTP_HOST, self.SMTP_PORT, timeout=30)
+        server.ehlo()
+        if server.has_extn("auth"):
+            server.login(self.SMTP_EMAIL, self.SMTP_PASSWORD)
+        return server
+
+    def _get_server(self) -> smtplib.SMTP:
+        if self._server is None:
+            self._server = self._connect()
+        return self._server
+
+    def close(self) -> None:
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
 
-    def send_email(self, to_email: str, subject: str, html_content: str):
+    def send_email(
+        self,
+        to_email: str,
+        subject: str,
+        html_content: str,
+        text_content: str | None = None,
+    ):
         try:
-            msg = MIMEText(html_content, "html")
+            if text_content:
+                msg = MIMEMultipart("alternative")
+                msg.attach(MIMEText(text_content, "plain"))
+                msg.attach(MIMEText(html_content, "html"))
+            else:
+                msg = MIMEText(html_content, "html")
             msg["Subject"] = subject
             msg["From"] = self.SMTP_EMAIL
             msg["To"] = to_email
 
-            with smtplib.SMTP_SSL(self.SMTP_HOST, self.SMTP_PORT) as server:
-                server.login(self.SMTP_EMAIL, self.SMTP_PASSWORD)
-                server.send_message(msg)
+            try:
+                self._get_server().send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                # The relay dropped the idle connection; reconnect once and retry.
+                self._server = None
+                self._get_server().send_message(msg)
             return True
         except Exception as e:
-            logger.error(f"Error sending email: {e}")
+            logger.error("Error sending email: %s", e)
+            self.close()
             return False
 
     def send_verification_email(self, to_email: str, verification_link: str) -> bool:
         subject = "Verify Your Email Address"
-        html_template = get_html_template(template_file_name="verification_email.html")
-        if not html_template:
-            print("Error: HTML template for verification email not found.")
+        context = {"verification_link": verification_link}
+        try:
+            html_content, text_content = render_email(
+                "verification_email.html", context
+            )
+        except Exception as e:
+            logger.error("Error rendering verification email: %s", e)
             return False
 
-        context = {"verification_link": verification_link}
-        html_content = render_html_template(html_template, context)
-        return self.send_email(to_email, subject, html_content)
+        return self.send_email(to_email, subject, html_content, text_content)
@@ -1,15 +1,60 @@
+import os
+import shutil
+import tempfile
 from typing import Any
 
 from gunicorn.app.base import BaseApplication
 from gunicorn.util import import_app
 
 
+def prepare_metrics_dir() -> None:
+    """Give the workers an empty directory to share Prometheus samples through.
+
+    Must run in the master before any worker imports prometheus_client.
+    """
+    metrics_dir = os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR",
+        os.path.join(tempfile.gettempdir(), "auth_service_metrics"),
+    )
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker) -> None:
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def when_ready(server) -> None:
+    from src.settings import settings
+
+    server.log.info(
+        f"{server.num_workers} workers, each with {settings.hashing_pool_size} "
+        f"hashing processes, {settings.db_pool_max_size} Postgres and "
+        f"{settings.redis_max_connections} Redis connections"
+    )
+
+
 class GunicornApplication(BaseApplication):
+    """Runs the app under gunicorn with uvicorn event-loop workers.
+
+    With `preload_app` the app is imported once in the master and the workers
+    fork from it, sharing its memory copy-on-write. Connection pools are opened
+    per worker by the lifespan, after the fork. `max_requests` recycles workers
+    (staggered by the jitter) to bound memory growth. Send HUP to replace the
+    workers gracefully; with `preload_app`, deploying new code needs USR2 to
+    start a new master, followed by QUIT to the old one.
+    """
+
     def __init__(self, app: str, host: str, port: int, workers: int = 1, **kwargs: Any):
+        prepare_metrics_dir()
         self.options = {
             "bind": f"{host}:{port}",
             "workers": workers,
             "worker_class": "uvicorn.workers.UvicornWorker",
+            "child_exit": child_exit,
+            "when_ready": when_ready,
             **kwargs,
         }
         self.application = app
@@ -15,11 +15,15 @@ def main() -> None:
         )
     else:
         GunicornApplication(
-            "src.application:get_app",
+            "src.application:get_app()",
             host=settings.host,
             port=settings.port,
             workers=settings.worker_count,
-            factory=True,
+            preload_app=settings.preload_app,
+            max_requests=settings.worker_max_requests,
+            max_requests_jitter=settings.worker_max_requests_jitter,
+            timeout=settings.worker_timeout,
+            graceful_timeout=settings.worker_graceful_timeout,
         ).run()
 
 
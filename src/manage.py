@@ -0,0 +1,367 @@
+"""Operational commands.
+
+python -m src.manage calibrate-argon2 --target-ms 250 --max-memory-mib 128
+python -m src.manage build-breached-filter pwned-passwords-sha1.txt breached.bloom
+python -m src.manage import-users legacy-users.csv
+python -m src.manage export-users users.ndjson --with-password-hashes
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import asyncpg
+from pwdlib.hashers.argon2 import Argon2Hasher
+from redis.exceptions import RedisError
+
+from src.db.bulk_users import (
+    FORMATS,
+    Checkpoint,
+    Progress,
+    detect_format,
+    export_users,
+    import_users,
+)
+from src.db.config import redis, redis_pool
+from src.settings import available_cpus, settings
+from src.utils.breached_passwords import build_filter, count_lines, read_digests
+
+# Memory levels tried by calibrate-argon2, in MiB.
+_MEMORY_LEVELS_MIB = (19, 32, 46, 64, 96, 128, 192, 256, 384, 512, 1024)
+_MAX_TIME_COST = 10
+# OWASP's minimum argon2id configurations (46 MiB x 1 pass, 19 MiB x 2,
+# 12 MiB x 3, 9 MiB x 4, 7 MiB x 5) all do about this much work.
+_MIN_MEMORY_PASSES_KIB = 7 * 1024 * 5
+_CALIBRATION_PASSWORD = "Calibration-Password-1!"
+
+
+def _measure(time_cost: int, memory_cost: int, parallelism: int, samples: int) -> dict:
+    """Median wall time and CPU time of one hash with these parameters."""
+    hasher = Argon2Hasher(
+        time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism
+    )
+    hasher.hash(_CALIBRATION_PASSWORD)
+    wall_times, cpu_times = [], []
+    for _ in range(samples):
+        wall_started_at = time.perf_counter()
+        cpu_started_at = time.process_time()
+        hasher.hash(_CALIBRATION_PASSWORD)
+        cpu_times.append(time.process_time() - cpu_started_at)
+        wall_times.append(time.perf_counter() - wall_started_at)
+    cpu_seconds = statistics.median(cpu_times)
+    return {
+        "time_cost": time_cost,
+        "memory_cost": memory_cost,
+        "parallelism": parallelism,
+        "median_ms": statistics.median(wall_times) * 1000,
+        # argon2 runs `parallelism` threads, so CPU time is what one core pays.
+        "hashes_per_second_per_core": 1 / cpu_seconds if cpu_seconds else 0.0,
+    }
+
+
+def calibrate_argon2(
+    target_ms: float, max_memory_mib: int, parallelism: int, samples: int
+) -> tuple[dict | None, list[dict]]:
+    """Measure a grid of argon2 costs and pick the costliest within `target_ms`.
+
+    For each memory level the time cost is raised until a hash takes longer
+    than the target; larger memory levels are skipped once even one pass is
+    over it. Returns (chosen parameters or None, every measurement).
+    """
+    measurements = []
+    for memory_mib in _MEMORY_LEVELS_MIB:
+        if memory_mib > max_memory_mib:
+            break
+        for time_cost in range(1, _MAX_TIME_COST + 1):
+            result = _measure(time_cost, memory_mib * 1024, parallelism, samples)
+            result["within_target"] = result["median_ms"] <= target_ms
+            measurements.append(result)
+            print(
+                f"m={memory_mib:>5} MiB t={time_cost:>2} p={parallelism}"
+                f"{result['median_ms']:>10.1f} ms"
+                f"{result['hashes_per_second_per_core']:>10.1f} hashes/s/core"
+            )
+            if not result["within_target"]:
+                break
+        if time_cost == 1 and not result["within_target"]:
+            break
+
+    candidates = [
+        result
+        for result in measurements
+        if result["within_target"]
+        and result["memory_cost"] * result["time_cost"] >= _MIN_MEMORY_PASSES_KIB
+    ]
+    chosen = max(
+        candidates,
+        key=lambda result: (
+            result["memory_cost"] * result["time_cost"],
+            result["memory_cost"],
+        ),
+        default=None,
+    )
+    return chosen, measurements
+
+
+def _write_env(path: Path, values: dict[str, int]) -> None:
+    """Set `values` in a .env file, replacing existing lines for the same keys."""
+    lines = path.read_text().splitlines() if path.exists() else []
+    remaining = dict(values)
+    for index, line in enumerate(lines):
+        key = line.split("=", 1)[0].strip()
+        if key in remaining:
+            lines[index] = f"{key}={remaining.pop(key)}"
+    lines += [f"{key}={value}" for key, value in remaining.items()]
+    path.write_text("\n".join(lines) + "\n")
+
+
+def _calibrate_argon2_command(args: argparse.Namespace) -> int:
+    print(
+        f"Calibrating argon2id for {args.target_ms:.0f} ms per hash "
+        f"on {available_cpus()} CPUs..."
+    )
+    chosen, measurements = calibrate_argon2(
+        args.target_ms, args.max_memory_mib, args.parallelism, args.samples
+    )
+    if args.output:
+        Path(args.output).write_text(
+            json.dumps(
+                {
+                    "target_ms": args.target_ms,
+                    "cpus": available_cpus(),
+                    "chosen": chosen,
+                    "measurements": measurements,
+                },
+                indent=2,
+            )
+        )
+    if chosen is None:
+        print(
+            "No parameters reach OWASP's minimum within the target; "
+            "raise --target-ms or run on a faster host."
+        )
+        return 1
+
+    values = {
+        "ARGON2_TIME_COST": chosen["time_cost"],
+        "ARGON2_MEMORY_COST": chosen["memory_cost"],
+        "ARGON2_PARALLELISM": chosen["parallelism"],
+    }
+    print(
+        f"\nChosen: {chosen['median_ms']:.1f} ms, "
+        f"{chosen['hashes_per_second_per_core']:.1f} hashes/s per core, "
+        f"{chosen['hashes_per_second_per_core'] * settings.hashing_pool_size:.1f} "
+        f"hashes/s per worker with {settings.hashing_pool_size} hashing processes."
+    )
+    for key, value in values.items():
+        print(f"{key}={value}")
+    if args.env_file:
+        _write_env(Path(args.env_file), values)
+        print(f"Updated {args.env_file}")
+    return 0
+
+
+def _build_breached_filter_command(args: argparse.Namespace) -> int:
+    # Sized by line count, so skipped entries only lower the error rate.
+    entries = args.entries or count_lines(args.source) + 1
+    started_at = time.perf_counter()
+    added = build_filter(
+        args.output,
+        read_digests(args.source, plaintext=args.plaintext, min_count=args.min_count),
+        entries,
+        args.false_positive_rate,
+    )
+    size_mib = Path(args.output).stat().st_size / 2**20
+    print(
+        f"Added {added} passwords to {args.output} ({size_mib:.1f} MiB) "
+        f"in {time.perf_counter() - started_at:.1f} s."
+    )
+    if added > entries:
+        print(
+            f"Warning: sized for {entries} entries; the false-positive rate is "
+            "above the target."
+        )
+    return 0
+
+
+async def _connect() -> asyncpg.Connection:
+    # One connection to the primary; COPY and cursors run for as long as needed.
+    return await asyncpg.connect(str(settings.database_url), command_timeout=None)
+
+
+def _import_users_command(args: argparse.Namespace) -> int:
+    try:
+        fmt = args.format or detect_format(args.source)
+        checkpoint = Checkpoint(
+            args.checkpoint or f"{args.source}.checkpoint", args.source
+        )
+        resuming = checkpoint.load()
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    if checkpoint.done:
+        print(
+            f"{args.source} was already imported; delete {checkpoint.path} "
+            "to import it again."
+        )
+        return 0
+    if resuming:
+        print(f"Resuming {args.source} after line {checkpoint.line}.")
+    rejects_path = args.rejects or f"{args.source}.rejects.ndjson"
+
+    async def run() -> None:
+        connection = await _connect()
+        try:
+            await import_users(
+                connection,
+                args.source,
+                fmt,
+                checkpoint,
+                rejects_path,
+                args.batch_size,
+                args.update_existing,
+                progress,
+            )
+        finally:
+            await connection.close()
+            await redis.aclose()
+            await redis_pool.aclose()
+
+    progress = Progress("read", args.report_seconds)
+    try:
+        asyncio.run(run())
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    except RedisError as e:
+        # The batch is committed but not checkpointed; a rerun rewrites it.
+        print(
+            f"Invalidating cached users failed ({e}). Run the same command "
+            "again to retry the last batch.",
+            file=sys.stderr,
+        )
+        return 1
+    progress.report(force=True)
+    if progress.rejected:
+        print(f"{progress.rejected} rows were rejected; see {rejects_path}.")
+    return 0
+
+
+def _export_users_command(args: argparse.Namespace) -> int:
+    if args.output == "-":
+        fmt = args.format or "ndjson"
+    else:
+        try:
+            fmt = args.format or detect_format(args.output)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+
+    async def run(output) -> None:
+        connection = await _connect()
+        try:
+            await export_users(
+                connection,
+                output,
+                fmt,
+                args.with_password_hashes,
+                args.after_id,
+                args.batch_size,
+                progress,
+            )
+        finally:
+            await connection.close()
+
+    progress = Progress("exported", args.report_seconds)
+    if args.output == "-":
+        asyncio.run(run(sys.stdout.buffer))
+        sys.stdout.buffer.flush()
+    else:
+        with open(args.output, "wb") as output:
+            asyncio.run(run(output))
+    progress.report(force=True)
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Operational commands.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    calibrate = commands.add_parser(
+        "calibrate-argon2",
+        help="measure argon2 on this host and pick costs for a target latency",
+    )
+    calibrate.add_argument("--target-ms", type=float, default=250.0)
+    calibrate.add_argument("--max-memory-mib", type=int, default=256)
+    calibrate.add_argument(
+        "--parallelism", type=int, default=settings.argon2_parallelism
+    )
+    calibrate.add_argument("--samples", type=int, default=5)
+    calibrate.add_argument("--env-file", help="write the chosen values to this file")
+    calibrate.add_argument("--output", help="write every measurement as JSON")
+    calibrate.set_defaults(handler=_calibrate_argon2_command)
+
+    breached = commands.add_parser(
+        "build-breached-filter",
+        help="build the breached-password filter from a list of SHA-1 hashes",
+    )
+    breached.add_argument("source", help="SHA-1 hex lines, optionally with :count")
+    breached.add_argument("output")
+    breached.add_argument("--false-positive-rate", type=float, default=0.001)
+    breached.add_argument(
+        "--entries", type=int, help="size for this many entries instead of counting"
+    )
+    breached.add_argument(
+        "--min-count", type=int, default=0, help="skip hashes seen fewer times"
+    )
+    breached.add_argument(
+        "--plaintext", action="store_true", help="source has one password per line"
+    )
+    breached.set_defaults(handler=_build_breached_filter_command)
+
+    import_ = commands.add_parser(
+        "import-users",
+        help="load users with password hashes from CSV or NDJSON, resumably",
+    )
+    import_.add_argument(
+        "source", help="rows with email, password_hash, is_verified, created_at"
+    )
+    import_.add_argument("--format", choices=FORMATS, help="default: from suffix")
+    import_.add_argument("--batch-size", type=int, default=10_000)
+    import_.add_argument(
+        "--update-existing",
+        action="store_true",
+        help="overwrite the hash and is_verified of existing emails",
+    )
+    import_.add_argument("--checkpoint", help="default: SOURCE.checkpoint")
+    import_.add_argument("--rejects", help="default: SOURCE.rejects.ndjson")
+    import_.add_argument("--report-seconds", type=float, default=5.0)
+    import_.set_defaults(handler=_import_users_command)
+
+    export = commands.add_parser(
+        "export-users", help="stream users out as CSV or NDJSON"
+    )
+    export.add_argument("output", help="file, or - for stdout")
+    export.add_argument("--format", choices=FORMATS, help="default: from suffix")
+    export.add_argument(
+        "--with-password-hashes",
+        action="store_true",
+        help="include password hashes, e.g. to import them elsewhere",
+    )
+    export.add_argument(
+        "--after-id", type=int, default=0, help="continue an interrupted export"
+    )
+    export.add_argument("--batch-size", type=int, default=10_000)
+    export.add_argument("--report-seconds", type=float, default=5.0)
+    export.set_defaults(handler=_export_users_command)
+
+    args = parser.parse_args()
+    raise SystemExit(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Screening of new passwords against a local filter of breached passwords.
+
+The filter is a blocked bloom filter keyed by the SHA-1 digest of the
+password, the format breached-password lists such as Have I Been Pwned's are
+published in. Every key sets or tests `num_hashes` bits inside one 64-byte
+block, so a lookup reads a single cache line (and at most one page) of the
+file, however large it is.
+
+`python -m src.manage build-breached-filter` writes the file. Workers map it
+read-only, so they all share the page cache's copy instead of each holding
+their own. A lookup can report a password that is not in the list with the
+false-positive rate the filter was built for, but never misses one that is.
+
+File layout: a 32-byte header (`_HEADER`), then `num_blocks` blocks of
+`BLOCK_BYTES`.
+"""
+
+import hashlib
+import math
+import mmap
+import struct
+from collections.abc import Iterable
+
+from src.settings import settings
+
+_MAGIC = b"BPWBLOOM"
+_VERSION = 1
+# magic, version, num_hashes, num_blocks, entries
+_HEADER = struct.Struct("<8sII QQ")
+BLOCK_BYTES = 64
+_BLOCK_BITS = BLOCK_BYTES * 8
+# Bit positions are 9-bit slices of the 128 digest bits left after the block.
+_MAX_HASHES = 14
+
+
+def password_digest(password: str) -> bytes:
+    return hashlib.sha1(password.encode()).digest()
+
+
+def _false_positive_rate(bits_per_entry: float, num_hashes: int) -> float:
+    """Expected false-positive rate of a full filter with these parameters.
+
+    The number of keys landing in a block is Poisson distributed, and
+    overloaded blocks dominate the error, so this sums over block loads
+    rather than using the classic bloom filter formula.
+    """
+    keys_per_block = _BLOCK_BITS / bits_per_entry
+    probability = math.exp(-keys_per_block)
+    rate = 0.0
+    for load in range(int(keys_per_block * 3) + 32):
+        if load:
+            probability *= keys_per_block / load
+        bit_set = 1 - (1 - 1 / _BLOCK_BITS) ** (num_hashes * load)
+        rate += probability * bit_set**num_hashes
+    return rate
+
+
+def filter_parameters(entries: int, false_positive_rate: float) -> tuple[int, int]:
+    """(num_blocks, num_hashes) for `entries` keys at `false_positive_rate`."""
+    # Start from the classic bloom filter size and grow until blocking's
+    # extra error is paid for.
+    bits_per_entry = -math.log(false_positive_rate) / math.log(2) ** 2
+    while True:
+        num_hashes = min(
+            range(1, _MAX_HASHES + 1),
+            key=lambda k: _false_positive_rate(bits_per_entry, k),
+        )
+        if _false_positive_rate(bits_per_entry, num_hashes) <= false_positive_rate:
+            break
+        bits_per_entry *= 1.01
+    num_blocks = max(math.ceil(entries * bits_per_entry / _BLOCK_BITS), 1)
+    return num_blocks, num_hashes
+
+
+def _positions(digest: bytes, num_blocks: int) -> tuple[int, int]:
+    """Offset of the key's block, and the bits whose 9-bit slices index into it."""
+    block = (int.from_bytes(digest[:4], "little") * num_blocks) >> 32
+    return _HEADER.size + block * BLOCK_BYTES, int.from_bytes(digest[4:], "little")
+
+
+def build_filter(
+    path: str, digests: Iterable[bytes], entries: int, false_positive_rate: float
+) -> int:
+    """Write a filter for `digests` sized for `entries` keys; returns keys added."""
+    num_blocks, num_hashes = filter_parameters(entries, false_positive_rate)
+    if num_blocks > 2**32:
+        raise ValueError("blocks are addressed by 32 bits of the digest")
+    size = _HEADER.size + num_blocks * BLOCK_BYTES
+    added = 0
+    with open(path, "w+b") as file:
+        file.truncate(size)
+        with mmap.mmap(file.fileno(), size) as bits:
+            for digest in digests:
+                offset, positions = _positions(digest, num_blocks)
+                for _ in range(num_hashes):
+                    bit = positions & (_BLOCK_BITS - 1)
+                    bits[offset + (bit >> 3)] |= 1 << (bit & 7)
+                    positions >>= 9
+                added += 1
+            bits[: _HEADER.size] = _HEADER.pack(
+                _MAGIC, _VERSION, num_hashes, num_blocks, added
+            )
+    return added
+
+
+class BreachedPasswordFilter:
+    """Read-only view of a filter file; `contains` is False until it is opened."""
+
+    def __init__(self, path: str | None):
+        self.path = path
+        self.entries = 0
+        self._bits: mmap.mmap | None = None
+        self._num_hashes = 0
+        self._num_blocks = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._bits is not None
+
+    def open(self) -> None:
+        if self._bits is not None or not self.path:
+            return
+        with open(self.path, "rb") as file:
+            bits = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, num_hashes, num_blocks, entries = _HEADER.unpack_from(bits)
+        if magic != _MAGIC or version != _VERSION:
+            bits.close()
+            raise ValueError(f"{self.path} is not a breached-password filter")
+        if len(bits) != _HEADER.size + num_blocks * BLOCK_BYTES:
+            bits.close()
+            raise ValueError(f"{self.path} is truncated")
+        # Lookups are random, so reading ahead only evicts useful pages.
+        if hasattr(mmap, "MADV_RANDOM"):
+            bits.madvise(mmap.MADV_RANDOM)
+        self._bits = bits
+        self._num_hashes = num_hashes
+        self._num_blocks = num_blocks
+        self.entries = entries
+
+    def close(self) -> None:
+        if self._bits is not None:
+            self._bits.close()
+            self._bits = None
+
+    def contains_digest(self, digest: bytes) -> bool:
+        bits = self._bits
+        if bits is None:
+            return False
+        offset, positions = _positions(digest, self._num_blocks)
+        for _ in range(self._num_hashes):
+            bit = positions & (_BLOCK_BITS - 1)
+            if not bits[offset + (bit >> 3)] & (1 << (bit & 7)):
+                return False
+            positions >>= 9
+        return True
+
+    def contains(self, password: str) -> bool:
+        return self.contains_digest(password_digest(password))
+
+
+def read_digests(path: str, plaintext: bool = False, min_count: int = 0):
+    """Yield SHA-1 digests from a list file.
+
+    Lines are `<40 hex digits>[:<count>]`, as in Have I Been Pwned's
+    downloads, or with `plaintext` one password per line. Entries seen fewer
+    than `min_count` times are skipped.
+    """
+    with open(path, "rb") as file:
+        for line in file:
+            line = line.rstrip(b"\r\n")
+            if not line:
+                continue
+            if plaintext:
+                yield hashlib.sha1(line).digest()
+                continue
+            hex_digest, _, count = line.partition(b":")
+            if min_count and count and int(count) < min_count:
+                continue
+            yield bytes.fromhex(hex_digest.decode())
+
+
+def count_lines(path: str) -> int:
+    with open(path, "rb") as file:
+        chunks = iter(lambda: file.read(1 << 20), b"")
+        return sum(chunk.count(b"\n") for chunk in chunks)
+
+
+breached_password_filter = BreachedPasswordFilter(
+    settings.breached_password_filter_path
+)
@@ -0,0 +1,172 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import status
+from pwdlib import PasswordHash
+from pwdlib.hashers.argon2 import Argon2Hasher
+from pwdlib.hashers.base import ensure_bytes
+from pwdlib.hashers.bcrypt import BcryptHasher
+
+from src.settings import settings
+from src.utils.metrics import (
+    PASSWORD_HASH_DURATION,
+    PASSWORD_HASH_QUEUE_DEPTH,
+    PASSWORD_HASH_REJECTED,
+    PASSWORD_HASH_WAIT,
+)
+from src.utils.schema import CustomException
+from src.utils.tracing import span
+
+
+class LegacyBcryptHasher(BcryptHasher):
+    """bcrypt as older libraries ran it, on the first 72 bytes of the password.
+
+    bcrypt 5 raises for longer passwords instead of ignoring the rest, which
+    would fail logins that the imported hashes were made to accept.
+    """
+
+    def verify(self, password: str | bytes, hash: str | bytes) -> bool:
+        return super().verify(ensure_bytes(password)[:72], hash)
+
+
+# Hasher used inside the pool processes; each child builds its own on import.
+# bcrypt hashes, from users imported with `manage import-users`, still verify
+# and are replaced with argon2id on the user's next login.
+password_hash = PasswordHash(
+    (
+        Argon2Hasher(
+            time_cost=settings.argon2_time_cost,
+            memory_cost=settings.argon2_memory_cost,
+            parallelism=settings.argon2_parallelism,
+        ),
+        LegacyBcryptHasher(),
+    )
+)
+
+
+def _hash(password: str) -> tuple[str, float]:
+    started_at = time.perf_counter()
+    hashed = password_hash.hash(password)
+    return hashed, time.perf_counter() - started_at
+
+
+def _verify(password: str, hashed_password: str) -> tuple[bool, float]:
+    started_at = time.perf_counter()
+    is_valid = password_hash.verify(password, hashed_password)
+    return is_valid, time.perf_counter() - started_at
+
+
+def _verify_and_update(
+    password: str, hashed_password: str
+) -> tuple[tuple[bool, str | None], float]:
+    started_at = time.perf_counter()
+    result = password_hash.verify_and_update(password, hashed_password)
+    return result, time.perf_counter() - started_at
+
+
+class HashingPool:
+    """Runs argon2 in a dedicated process pool so it never blocks the event loop.
+
+    At most `pool_size + queue_size` operations are admitted at once; anything
+    beyond that is rejected immediately with a 503 so callers can back off
+    instead of queueing behind a burst of logins.
+    """
+
+    def __init__(self, pool_size: int, queue_size: int):
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        self._executor: ProcessPoolExecutor | None = None
+        self._in_flight = 0
+        self._rejected = 0
+        self._completed = 0
+        self._hash_seconds_total = 0.0
+        self._hash_seconds_max = 0.0
+
+    def start(self) -> None:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.pool_size,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+    async def shutdown(self) -> None:
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            # Waiting for running hashes blocks, so keep it off the event loop.
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+    @property
+    def queue_depth(self) -> int:
+        return max(self._in_flight - self.pool_size, 0)
+
+    def stats(self) -> dict:
+        return {
+            "pool_size": self.pool_size,
+            "queue_size": self.queue_size,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "hash_seconds_avg": (
+                self._hash_seconds_total / self._completed if self._completed else 0.0
+            ),
+            "hash_seconds_max": self._hash_seconds_max,
+        }
+
+    async def hash(self, password: str) -> str:
+        hashed, _ = await self._submit("hash", _hash, password)
+        return hashed
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        is_valid, _ = await self._submit("verify", _verify, password, hashed_password)
+        return is_valid
+
+    async def verify_and_update(
+        self, password: str, hashed_password: str
+    ) -> tuple[bool, str | None]:
+        """Verify, and rehash in the same call if the hash uses other parameters."""
+        result, _ = await self._submit(
+            "verify_and_update", _verify_and_update, password, hashed_password
+        )
+        return result
+
+    async def _submit(self, operation: str, func, *args):
+        if self._in_flight >= self.pool_size + self.queue_size:
+            self._rejected += 1
+            PASSWORD_HASH_REJECTED.inc()
+            raise CustomException(
+                message="The service is busy. Please retry shortly.",
+                error="server_busy",
+                error_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "1"},
+            )
+
+        self.start()
+        self._in_flight += 1
+        PASSWORD_HASH_QUEUE_DEPTH.set(self.queue_depth)
+        submitted_at = time.perf_counter()
+        try:
+            with span("hashing", operation):
+                loop = asyncio.get_running_loop()
+                result, elapsed = await loop.run_in_executor(
+                    self._executor, func, *args
+                )
+        finally:
+            self._in_flight -= 1
+            PASSWORD_HASH_QUEUE_DEPTH.set(self.queue_depth)
+
+        PASSWORD_HASH_WAIT.labels(operation).observe(time.perf_counter() - submitted_at)
+        PASSWORD_HASH_DURATION.labels(operation).observe(elapsed)
+
+        self._completed += 1
+        self._hash_seconds_total += elapsed
+        self._hash_seconds_max = max(self._hash_seconds_max, elapsed)
+        return result, elapsed
+
+
+hashing_pool = HashingPool(
+    pool_size=settings.hashing_pool_size,
+    queue_size=settings.hashing_queue_size,
+)
@@ -1,26 +1,55 @@
 import logging
 from pathlib import Path
 
-from jinja2 import Template
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    select_autoescape,
+)
+
+from src.settings import settings
 
 logger = logging.getLogger("stdout")
 
+TEMPLATES_DIR = Path(__file__).resolve().parents[1] / "htmls"
+
+
+def _build_template_environment() -> Environment:
+    bytecode_cache = None
+    if settings.template_bytecode_cache_dir:
+        cache_dir = Path(settings.template_bytecode_cache_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(str(cache_dir))
+
+    # Templates ship with the code, so there is no need to stat them on reuse.
+    return Environment(
+        loader=FileSystemLoader(TEMPLATES_DIR),
+        autoescape=select_autoescape(["html", "htm", "xml"]),
+        bytecode_cache=bytecode_cache,
+        auto_reload=False,
+    )
+
+
+template_environment = _build_template_environment()
+_template_names = frozenset(template_environment.list_templates())
+
+
+def warm_templates() -> None:
+    """Compile every template up front so the first email does not pay for it."""
+    for template_name in _template_names:
+        template_environment.get_template(template_name)
+
+
+def render_template(template_name: str, context: dict) -> str:
+    return template_environment.get_template(template_name).render(**context)
+
 
-def get_html_template(template_file_name: str) -> str:
-    html_template = ""
-    try:
-        base_dir = Path(__file__).resolve().parents[1]
-        template_path = base_dir / "htmls" / template_file_name
-        html_template = template_path.read_text(encoding="utf-8")
-    except Exception as e:
-        logger.error(f"Error reading verification template at {template_path}: {e}")
-    return html_template
-
-
-def render_html_template(html_template: str, context: dict) -> str:
-    try:
-        template = Template(html_template)
-        return template.render(**context)
-    except Exception as e:
-        logger.error(f"Error rendering HTML template: {e}")
-    return html_template
+def render_email(html_template_name: str, context: dict) -> tuple[str, str | None]:
+    """Render an email's HTML part and, if a `.txt` sibling exists, its text part."""
+    html_content = render_template(html_template_name, context)
+    text_template_name = str(Path(html_template_name).with_suffix(".txt"))
+    text_content = None
+    if text_template_name in _template_names:
+        text_content = render_template(text_template_name, context)
+    return html_content, text_content
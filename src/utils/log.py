@@ -0,0 +1,234 @@
+"""Logging for the API workers and the email worker.
+
+`configure_logging()` runs once per process. It points the "stdout" logger at
+a `QueueHandler`, so logging on the event loop only appends the record to a
+bounded in-memory queue. A `QueueListener` thread formats the records as JSON
+lines and writes them to stdout. Messages are %-formatted in that thread,
+which is why call sites pass arguments instead of f-strings:
+
+    logger.error("Error sending email to %s: %s", to_email, e)
+
+Before queueing, the calling thread stamps each record with the request id
+and trace id of the current request. It also passes the record through
+`ErrorSampler`. During an outage the same error repeats for every request,
+so after `log_error_burst` records with one message template within
+`log_error_window_seconds`, the rest are counted and dropped. The next record
+that gets through reports how many were dropped. When the queue is full,
+records are dropped rather than blocking the worker.
+
+Email addresses in messages and tracebacks are masked, e.g. `j***@example.com`.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+import orjson
+
+from src.settings import settings
+from src.utils.metrics import LOG_RECORDS_DROPPED
+from src.utils.tracing import current_trace_id
+
+LOGGER_NAME = "stdout"
+
+_EMAIL = re.compile(
+    r"([A-Za-z0-9._%+-])[A-Za-z0-9._%+-]*@([A-Za-z0-9.-]+\.[A-Za-z]{2,})"
+)
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+
+def redact(text: str) -> str:
+    return _EMAIL.sub(r"\1***@\2", text)
+
+
+class ErrorSampler(logging.Filter):
+    """Lets through at most `burst` errors per message template per `window`."""
+
+    def __init__(self, burst: int, window: float):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        # (logger, template) -> [window started at, records let through, dropped]
+        self._windows: dict[tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.ERROR:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                if len(self._windows) > 10_000:
+                    self._windows.clear()
+                state = self._windows[key] = [now, 0, state[2] if state else 0]
+            if state[1] >= self.burst:
+                state[2] += 1
+                LOG_RECORDS_DROPPED.labels("sampled").inc()
+                return False
+            state[1] += 1
+            if state[2]:
+                record.suppressed = state[2]
+                state[2] = 0
+        return True
+
+
+class ContextFilter(logging.Filter):
+    """Stamps records with the current request, in the thread that logs them."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        record.trace_id = current_trace_id()
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queues records as they are; formatting is left to the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels("queue_full").inc()
+
+
+class JsonFormatter(logging.Formatter):
+    converter = time.gmtime
+
+    def __init__(self, redact_emails: bool = True):
+        super().__init__()
+        self.redact_emails = redact_emails
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S")
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": message,
+            "pid": record.process,
+        }
+        for field in ("request_id", "trace_id", "suppressed"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if self.redact_emails:
+            entry["message"] = redact(message)
+            if "exception" in entry:
+                entry["exception"] = redact(entry["exception"])
+        return orjson.dumps(entry).decode()
+
+
+class PlainFormatter(logging.Formatter):
+    def __init__(self, redact_emails: bool = True):
+        super().__init__("%(asctime)s %(levelname)s [%(request_id)s] %(message)s")
+        self.redact_emails = redact_emails
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "request_id"):
+            record.request_id = None
+        text = super().format(record)
+        return redact(text) if self.redact_emails else text
+
+
+_listener: QueueListener | None = None
+_configured_pid: int | None = None
+
+
+def configure_logging() -> None:
+    """Route the "stdout" logger through a queue to a background writer thread.
+
+    Safe to call repeatedly; a forked child (a gunicorn worker of a preloaded
+    master) gets its own queue and thread, since threads do not survive fork.
+    """
+    global _listener, _configured_pid
+    if _configured_pid == os.getpid():
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    formatter_class = JsonFormatter if settings.log_json else PlainFormatter
+    stream.setFormatter(formatter_class(redact_emails=settings.log_redact_emails))
+
+    records = queue.Queue(maxsize=settings.log_queue_size)
+    handler = DroppingQueueHandler(records)
+    handler.addFilter(
+        ErrorSampler(settings.log_error_burst, settings.log_error_window_seconds)
+    )
+    handler.addFilter(ContextFilter())
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.handlers = [handler]
+    logger.setLevel(settings.log_level.upper())
+    logger.propagate = False
+
+    _listener = QueueListener(records, stream, respect_handler_level=True)
+    _listener.start()
+    _configured_pid = os.getpid()
+
+
+def _stop_listener() -> None:
+    if _listener is not None and _configured_pid == os.getpid():
+        _listener.stop()
+
+
+def _after_fork() -> None:
+    if _configured_pid is not None:
+        configure_logging()
+
+
+atexit.register(_stop_listener)
+os.register_at_fork(after_in_child=_after_fork)
+
+
+class RequestIdMiddleware:
+    """Sets the request id for logs, from `X-Request-ID` or a new one.
+
+    The id is echoed back in the `X-Request-ID` response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        value = None
+        for name, header in scope["headers"]:
+            if name == b"x-request-id":
+                value = header.decode("latin-1")
+                break
+        if value is None or not _REQUEST_ID.match(value):
+            value = uuid.uuid4().hex
+        token = request_id.set(value)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", ()),
+                    (b"x-request-id", value.encode("latin-1")),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id.reset(token)
@@ -0,0 +1,167 @@
+"""Prometheus metrics shared by the API workers and background processes.
+
+Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+(prepared by `GunicornApplication`), and `/metrics` aggregates all of them, so
+any worker can answer a scrape. Without that variable, for example under
+`uvicorn --reload`, the default single-process registry is used.
+"""
+
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route.",
+    ["method", "route", "status"],
+)
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds",
+    "CPU time of argon2 operations inside the hashing pool.",
+    ["operation"],
+)
+PASSWORD_HASH_WAIT = Histogram(
+    "password_hash_wait_seconds",
+    "Time from submitting an argon2 operation until its result is available.",
+    ["operation"],
+)
+PASSWORD_HASH_QUEUE_DEPTH = Gauge(
+    "password_hash_queue_depth",
+    "Argon2 operations waiting for a free hashing process.",
+    multiprocess_mode="livesum",
+)
+PASSWORD_HASH_REJECTED = Counter(
+    "password_hash_rejected_total",
+    "Argon2 operations shed because the hashing queue was full.",
+)
+PASSWORD_REHASHES = Counter(
+    "password_rehashes_total",
+    "Stored hashes rewritten at login because the argon2 parameters changed.",
+    ["result"],
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Latency of user queries.",
+    ["query"],
+)
+REDIS_COMMAND_DURATION = Histogram(
+    "redis_command_duration_seconds",
+    "Latency of Redis commands and pipelines.",
+    ["command"],
+)
+EMAIL_SEND_DURATION = Histogram(
+    "email_send_duration_seconds",
+    "Latency of email deliveries by transport.",
+    ["transport", "status"],
+)
+RATE_LIMIT_DECISIONS = Counter(
+    "rate_limit_decisions_total",
+    "Rate limiter outcomes: allowed, rejected by the local bucket or by a "
+    "Redis window, or allowed because Redis failed.",
+    ["limiter", "result"],
+)
+TRACING_SPANS = Counter(
+    "tracing_spans_total",
+    "Spans of sampled requests: exported, failed to export, or dropped "
+    "because the export queue was full.",
+    ["result"],
+)
+SINGLE_FLIGHT_CALLS = Counter(
+    "single_flight_calls_total",
+    "Calls that ran (leader) or joined an identical call in flight (coalesced).",
+    ["name", "result"],
+)
+SINGLE_FLIGHT_LOCKS = Counter(
+    "single_flight_locks_total",
+    "Cross-worker single-flight locks: acquired at once, after waiting, timed "
+    "out, or skipped because Redis failed.",
+    ["name", "result"],
+)
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total",
+    "Log records dropped by the error sampler or because the log queue was full.",
+    ["reason"],
+)
+POOL_CONNECTIONS_IN_USE = Gauge(
+    "pool_connections_in_use",
+    "Connections currently checked out of a pool.",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+POOL_CONNECTIONS_MAX = Gauge(
+    "pool_connections_max",
+    "Maximum size of a pool.",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def route_label(scope) -> str:
+    """Path template of the matched route, keeping label cardinality bounded."""
+    if scope.get("route") is None:
+        return "unmatched"
+    path = scope["path"]
+    for name, value in scope.get("path_params", {}).items():
+        path = path.replace(str(value), f"{{{name}}}", 1)
+    return path
+
+
+class MetricsMiddleware:
+    """Records request latency per route template and samples pool usage.
+
+    Pool gauges are refreshed at most once per `sample_interval` seconds so
+    the per-request cost stays at one histogram observation.
+    """
+
+    def __init__(self, app, sample_pools=None, sample_interval: float = 1.0):
+        self.app = app
+        self.sample_pools = sample_pools
+        self.sample_interval = sample_interval
+        self._last_sample = 0.0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_DURATION.labels(
+                scope["method"], route_label(scope), status_code
+            ).observe(time.perf_counter() - started_at)
+
+            if (
+                self.sample_pools
+                and started_at - self._last_sample > self.sample_interval
+            ):
+                self._last_sample = started_at
+                self.sample_pools()
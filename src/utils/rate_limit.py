@@ -0,0 +1,184 @@
+"""Rate limits for endpoints that run argon2, checked before any hashing or DB work.
+
+Each limiter enforces a per-IP and a per-email limit over a sliding window,
+approximated from two fixed-window counters in Redis: the previous window's
+count is weighted by how much of it still overlaps the sliding window. One Lua
+script checks and increments both limits atomically, in one round trip. Only
+allowed requests are counted.
+
+In front of Redis, every worker keeps a token bucket per IP that refills at
+the per-IP limit. A single worker seeing more than that from one IP is over
+the fleet-wide limit anyway, so such floods are rejected without Redis.
+
+If Redis is unavailable the request is allowed; the hashing pool's admission
+control still bounds the CPU spent on it.
+"""
+
+import hashlib
+import logging
+import math
+import time
+
+from fastapi import Request, status
+
+from src.db.config import redis
+from src.settings import settings
+from src.utils.cache import LRUCache
+from src.utils.metrics import RATE_LIMIT_DECISIONS
+from src.utils.schema import CustomException
+
+logger = logging.getLogger("stdout")
+
+# KEYS = (current window counter, previous window counter) for each limit
+# ARGV[1] = window length in ms, ARGV[2] = ms elapsed in the current window,
+# ARGV[3..] = the limit for each pair of keys
+# Returns {0, 0} if allowed, else {1-based index of the limit, retry after ms}
+_CHECK_AND_INCREMENT = redis.register_script(
+    """
+    local window = tonumber(ARGV[1])
+    local elapsed = tonumber(ARGV[2])
+    local weight = (window - elapsed) / window
+    for i = 1, #KEYS, 2 do
+        local index = (i + 1) / 2
+        local limit = tonumber(ARGV[2 + index])
+        local current = tonumber(redis.call('GET', KEYS[i]) or '0')
+        local previous = tonumber(redis.call('GET', KEYS[i + 1]) or '0')
+        if previous * weight + current + 1 > limit then
+            local retry_after = window - elapsed
+            if current + 1 <= limit then
+                retry_after = window * (1 - (limit - current - 1) / previous) - elapsed
+            end
+            return {index, math.ceil(retry_after)}
+        end
+    end
+    for i = 1, #KEYS, 2 do
+        redis.call('INCR', KEYS[i])
+        redis.call('PEXPIRE', KEYS[i], window * 2)
+    end
+    return {0, 0}
+    """
+)
+
+
+class TokenBuckets:
+    """Per-worker token buckets, one per key, holding at most `capacity` tokens."""
+
+    def __init__(self, rate: float, capacity: int, max_keys: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets = LRUCache(max_entries=max_keys)
+
+    def take(self, key: str) -> float:
+        """Take a token; returns 0 on success, else seconds until one is available."""
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated_at) * self.rate)
+        if tokens < 1:
+            self._buckets.set(key, (tokens, now))
+            return (1 - tokens) / self.rate
+        self._buckets.set(key, (tokens - 1, now))
+        return 0.0
+
+
+def _hashed(value: str) -> str:
+    return hashlib.blake2b(value.encode(), digest_size=12).hexdigest()
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        name: str,
+        per_ip: int,
+        per_email: int,
+        window_seconds: int = settings.rate_limit_window_seconds,
+        local_max_keys: int = settings.rate_limit_local_max_keys,
+    ):
+        self.name = name
+        self.per_ip = per_ip
+        self.per_email = per_email
+        self.window_ms = window_seconds * 1000
+        self.local_buckets = None
+        if per_ip:
+            self.local_buckets = TokenBuckets(
+                rate=per_ip / window_seconds, capacity=per_ip, max_keys=local_max_keys
+            )
+
+    def _reject(self, result: str, retry_after: float) -> CustomException:
+        RATE_LIMIT_DECISIONS.labels(self.name, result).inc()
+        return CustomException(
+            message="Too many attempts. Please try again later.",
+            error="rate_limited",
+            error_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+        )
+
+    async def check(self, ip: str | None, email: str | None) -> None:
+        """Count one attempt, or raise a 429 if it would exceed a limit."""
+        if ip and self.local_buckets:
+            wait = self.local_buckets.take(ip)
+            if wait:
+                raise self._reject("rejected_local", wait)
+
+        # (metric result, key subject, limit) for each limit that applies
+        limits = []
+        if ip and self.per_ip:
+            limits.append(("rejected_ip", f"ip:{ip}", self.per_ip))
+        if email and self.per_email:
+            limits.append(("rejected_email", f"email:{_hashed(email)}", self.per_email))
+        if not limits:
+            return
+
+        now_ms = int(time.time() * 1000)
+        window_index, elapsed = divmod(now_ms, self.window_ms)
+        keys = []
+        for _, subject, _ in limits:
+            prefix = f"rate_limit:{self.name}:{subject}"
+            keys += [f"{prefix}:{window_index}", f"{prefix}:{window_index - 1}"]
+        try:
+            rejected_index, retry_after_ms = await _CHECK_AND_INCREMENT(
+                keys=keys,
+                args=[self.window_ms, elapsed, *(limit for _, _, limit in limits)],
+            )
+        except Exception as e:
+            logger.error("Rate limiter %s failed, allowing request: %s", self.name, e)
+            RATE_LIMIT_DECISIONS.labels(self.name, "error").inc()
+            return
+
+        if rejected_index:
+            raise self._reject(limits[rejected_index - 1][0], retry_after_ms / 1000)
+        RATE_LIMIT_DECISIONS.labels(self.name, "allowed").inc()
+
+
+async def _client_and_email(request: Request) -> tuple[str | None, str | None]:
+    ip = request.client.host if request.client else None
+    email = None
+    try:
+        # FastAPI has already parsed the body, so this reads its cached JSON.
+        body = await request.json()
+    except ValueError:
+        body = None
+    if isinstance(body, dict) and isinstance(body.get("email"), str):
+        email = body["email"].strip().lower()
+    return ip, email
+
+
+login_limiter = RateLimiter(
+    "login",
+    per_ip=settings.rate_limit_login_per_ip,
+    per_email=settings.rate_limit_login_per_email,
+)
+register_limiter = RateLimiter(
+    "register",
+    per_ip=settings.rate_limit_register_per_ip,
+    per_email=settings.rate_limit_register_per_email,
+)
+
+
+async def limit_login(request: Request) -> None:
+    if settings.rate_limit_enabled:
+        await login_limiter.check(*await _client_and_email(request))
+
+
+async def limit_register(request: Request) -> None:
+    if settings.rate_limit_enabled:
+        await register_limiter.check(*await _client_and_email(request))
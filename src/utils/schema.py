@@ -8,6 +8,7 @@ class CustomException(HTTPException):
         message: str | None = None,
         error: str | None = None,
         error_code: int | None = None,
+        headers: dict[str, str] | None = None,
     ):
         if message is None:
             message = "Something Unexpected Happened."
@@ -17,12 +18,12 @@ class CustomException(HTTPException):
             error_code = 400
 
         detail = {"success": False, "message": message, "error": error}
-        super().__init__(status_code=error_code, detail=detail)
+        super().__init__(status_code=error_code, detail=detail, headers=headers)
 
 
-class ResponseSchema(BaseModel):
+class ResponseSchema[DataT](BaseModel):
     success: bool
-    dataSource: dict | None = None
+    dataSource: DataT | None = None
 
 
 class MessageResponseSchema(BaseModel):
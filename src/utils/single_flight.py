@@ -0,0 +1,114 @@
+"""Coalescing of concurrent identical calls.
+
+`SingleFlight.do(key, func, *args)` runs `func` once for all callers that
+ask for the same key while a call is in flight; later callers await the
+first call's task and share its result or exception. The task is shielded,
+so a caller that disconnects does not cancel it for the others.
+
+`redis_lock` extends this across workers for work that must not run twice
+at once anywhere, such as a registration: the first worker to set the lock
+key runs, the others poll until it is released. If Redis is unavailable
+the lock is skipped, leaving only the in-process coalescing.
+"""
+
+import asyncio
+import logging
+import secrets
+import time
+from collections.abc import Hashable
+from contextlib import asynccontextmanager
+
+from fastapi import status
+
+from src.db.config import redis
+from src.settings import settings
+from src.utils.metrics import SINGLE_FLIGHT_CALLS, SINGLE_FLIGHT_LOCKS
+from src.utils.schema import CustomException
+
+logger = logging.getLogger("stdout")
+
+# KEYS[1] = lock key, ARGV[1] = the holder's token
+_RELEASE = redis.register_script(
+    """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+)
+_LOCK_POLL_SECONDS = 0.05
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, func, *args):
+        task = self._calls.get(key)
+        if task is None:
+            SINGLE_FLIGHT_CALLS.labels(self.name, "leader").inc()
+            task = asyncio.ensure_future(func(*args))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._finish(key, task))
+        else:
+            SINGLE_FLIGHT_CALLS.labels(self.name, "coalesced").inc()
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        del self._calls[key]
+        # Mark the exception retrieved, in case every caller was cancelled.
+        if not task.cancelled():
+            task.exception()
+
+
+@asynccontextmanager
+async def redis_lock(
+    name: str,
+    key: str,
+    ttl_seconds: float = settings.single_flight_lock_seconds,
+    wait_seconds: float = settings.single_flight_wait_seconds,
+):
+    """Hold `single_flight:{name}:{key}` in Redis, waiting up to `wait_seconds`.
+
+    Raises a 409 if another worker still holds the lock after the wait. The
+    lock expires after `ttl_seconds` in case its holder dies.
+    """
+    lock_key = f"single_flight:{name}:{key}"
+    token = secrets.token_hex(8)
+    ttl_ms = int(ttl_seconds * 1000)
+    deadline = time.monotonic() + wait_seconds
+    result = "acquired"
+    try:
+        while not await redis.set(lock_key, token, nx=True, px=ttl_ms):
+            result = "waited"
+            if time.monotonic() >= deadline:
+                result = "timeout"
+                break
+            await asyncio.sleep(_LOCK_POLL_SECONDS)
+    except Exception as e:
+        logger.error("Single-flight lock %s unavailable, running unlocked: %s", name, e)
+        result = "error"
+
+    SINGLE_FLIGHT_LOCKS.labels(name, result).inc()
+    if result == "timeout":
+        raise CustomException(
+            message="The same request is already being processed. Please retry shortly.",
+            error="request_in_progress",
+            error_code=status.HTTP_409_CONFLICT,
+            headers={"Retry-After": "1"},
+        )
+    if result == "error":
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        try:
+            await _RELEASE(keys=[lock_key], args=[token])
+        except Exception as e:
+            logger.error("Failed to release single-flight lock %s: %s", name, e)
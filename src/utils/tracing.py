@@ -0,0 +1,359 @@
+"""Per-request tracing: spans, a Server-Timing header and batched export.
+
+`TracingMiddleware` opens a trace for every HTTP request. Code on the request
+path wraps its stages in `span(stage, operation)`; the Redis client, user
+queries, hashing pool, JWT keys and email outbox already do. Span durations
+are summed per stage into the `Server-Timing` response header, e.g.
+
+    Server-Timing: db;dur=1.8, redis;dur=0.6, hashing;dur=291.3, total;dur=296.0
+
+for every request, sampled or not. Nested stages count towards each, e.g. the
+Redis pipeline inside `email`. Only sampled traces keep their spans and
+hand them to `span_exporter`, which writes them in batches, in the OTLP/JSON
+encoding, to a file or to an OTLP/HTTP collector.
+
+A request is sampled if its `traceparent` header says so or, without one,
+with probability `tracing_sample_rate`. Outside a request `span` does
+nothing, and with tracing disabled neither does the middleware.
+"""
+
+import asyncio
+import logging
+import random
+import re
+import time
+import urllib.request
+from collections import deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+import orjson
+
+from src.settings import settings
+from src.utils.metrics import TRACING_SPANS, route_label
+
+logger = logging.getLogger("stdout")
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_NO_SPAN = nullcontext()
+_SPAN_KIND_INTERNAL, _SPAN_KIND_SERVER = 1, 2
+_STATUS_ERROR = 2
+
+
+class Trace:
+    """Spans of one request. Times are perf_counter_ns readings."""
+
+    __slots__ = ("trace_id", "sampled", "spans", "timings", "clock_offset_ns")
+
+    def __init__(self, trace_id: int, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: list[Span] = []
+        # Summed duration per stage, for the Server-Timing header
+        self.timings: dict[str, int] = {}
+        # Converts perf_counter_ns readings to UNIX time for export
+        self.clock_offset_ns = time.time_ns() - time.perf_counter_ns()
+
+
+class Span:
+    __slots__ = (
+        "trace",
+        "name",
+        "stage",
+        "span_id",
+        "parent_id",
+        "kind",
+        "attributes",
+        "start_ns",
+        "end_ns",
+        "is_error",
+        "_token",
+    )
+
+    def __init__(
+        self,
+        trace: Trace,
+        name: str,
+        stage: str | None,
+        parent_id: int | None,
+        kind: int,
+        attributes: dict,
+    ):
+        self.trace = trace
+        self.name = name
+        self.stage = stage
+        # Ids are only needed to export spans.
+        self.span_id = random.getrandbits(64) if trace.sampled else 0
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+        self.is_error = False
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.end_ns = time.perf_counter_ns()
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.is_error = True
+            self.attributes["exception.type"] = exc_type.__name__
+        trace = self.trace
+        if self.stage is not None:
+            trace.timings[self.stage] = (
+                trace.timings.get(self.stage, 0) + self.end_ns - self.start_ns
+            )
+        if trace.sampled:
+            trace.spans.append(self)
+
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def span(stage: str, operation: str | None = None, **attributes):
+    """Time a stage of the current request, e.g. `span("db", "create_user")`.
+
+    The stage names the Server-Timing entry and the operation, if any, is
+    appended to it for the span name.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return _NO_SPAN
+    name = f"{stage}.{operation}" if operation else stage
+    return Span(
+        parent.trace, name, stage, parent.span_id, _SPAN_KIND_INTERNAL, attributes
+    )
+
+
+def current_trace_id() -> str | None:
+    """Id of the current request's trace, if it is sampled and so exported."""
+    current = _current_span.get()
+    if current is None or not current.trace.sampled:
+        return None
+    return f"{current.trace.trace_id:032x}"
+
+
+def _parse_traceparent(scope) -> tuple[int, int, bool] | None:
+    for name, value in scope["headers"]:
+        if name == b"traceparent":
+            match = _TRACEPARENT.match(value.decode("latin-1").strip())
+            if match is None:
+                return None
+            trace_id, parent_id, flags = match.groups()
+            return int(trace_id, 16), int(parent_id, 16), bool(int(flags, 16) & 1)
+    return None
+
+
+def server_timing(trace: Trace, total_ns: int) -> bytes:
+    entries = [
+        f"{stage};dur={duration / 1e6:.1f}" for stage, duration in trace.timings.items()
+    ]
+    entries.append(f"total;dur={total_ns / 1e6:.1f}")
+    return ", ".join(entries).encode("latin-1")
+
+
+class TracingMiddleware:
+    """Opens the root span of each request and adds the Server-Timing header."""
+
+    def __init__(self, app, sample_rate: float = settings.tracing_sample_rate):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.tracing_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        parent = _parse_traceparent(scope)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = random.getrandbits(128), None
+            sampled = random.random() < self.sample_rate
+        trace = Trace(trace_id, sampled)
+        root = Span(
+            trace,
+            f"{scope['method']} request",
+            None,
+            parent_id,
+            _SPAN_KIND_SERVER,
+            {"http.method": scope["method"], "http.target": scope["path"]},
+        )
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+                if settings.tracing_server_timing:
+                    total_ns = time.perf_counter_ns() - root.start_ns
+                    message["headers"] = [
+                        *message.get("headers", ()),
+                        (b"server-timing", server_timing(trace, total_ns)),
+                    ]
+            await send(message)
+
+        try:
+            with root:
+                await self.app(scope, receive, send_wrapper)
+        finally:
+            # Also for unhandled exceptions, the requests most worth a trace.
+            if root.attributes.get("http.status_code", 500) >= 500:
+                root.is_error = True
+            if sampled:
+                route = route_label(scope)
+                root.name = f"{scope['method']} {route}"
+                root.attributes["http.route"] = route
+                span_exporter.add(trace.spans)
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        encoded = {"boolValue": value}
+    elif isinstance(value, int):
+        encoded = {"intValue": str(value)}
+    elif isinstance(value, float):
+        encoded = {"doubleValue": value}
+    else:
+        encoded = {"stringValue": str(value)}
+    return {"key": key, "value": encoded}
+
+
+def _encode_span(span: Span) -> dict:
+    offset = span.trace.clock_offset_ns
+    encoded = {
+        "traceId": f"{span.trace.trace_id:032x}",
+        "spanId": f"{span.span_id:016x}",
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns + offset),
+        "endTimeUnixNano": str(span.end_ns + offset),
+        "attributes": [_attribute(k, v) for k, v in span.attributes.items()],
+    }
+    if span.parent_id is not None:
+        encoded["parentSpanId"] = f"{span.parent_id:016x}"
+    if span.is_error:
+        encoded["status"] = {"code": _STATUS_ERROR}
+    return encoded
+
+
+class BatchSpanExporter:
+    """Buffers finished spans and exports them from a background task.
+
+    A batch is sent every `interval` seconds, or sooner once `batch_size`
+    spans are waiting. Spans beyond `queue_size` are dropped rather than
+    slowing requests down. Encoding and I/O run in a thread.
+    """
+
+    def __init__(
+        self,
+        exporter: str,
+        file_path: str,
+        otlp_endpoint: str,
+        batch_size: int,
+        queue_size: int,
+        interval: float,
+    ):
+        self.exporter = exporter
+        self.file_path = file_path
+        self.otlp_endpoint = otlp_endpoint
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.interval = interval
+        self._queue: deque[Span] = deque()
+        self._batch_ready = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self.exporter != "none" and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def shutdown(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            while self._queue:
+                await self._export_batch()
+
+    def add(self, spans: list[Span]) -> None:
+        if self._task is None:
+            return
+        room = self.queue_size - len(self._queue)
+        if len(spans) > room:
+            TRACING_SPANS.labels("dropped").inc(len(spans) - max(room, 0))
+            spans = spans[: max(room, 0)]
+        self._queue.extend(spans)
+        if len(self._queue) >= self.batch_size:
+            self._batch_ready.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with asyncio.timeout(self.interval):
+                    await self._batch_ready.wait()
+            except TimeoutError:
+                pass
+            self._batch_ready.clear()
+            while self._queue:
+                await self._export_batch()
+
+    async def _export_batch(self) -> None:
+        count = min(len(self._queue), self.batch_size)
+        batch = [self._queue.popleft() for _ in range(count)]
+        try:
+            await asyncio.to_thread(self._export, batch)
+            TRACING_SPANS.labels("exported").inc(count)
+        except Exception as e:
+            TRACING_SPANS.labels("failed").inc(count)
+            logger.error("Failed to export %s spans: %s", count, e)
+
+    def _export(self, batch: list[Span]) -> None:
+        payload = orjson.dumps(
+            {
+                "resourceSpans": [
+                    {
+                        "resource": {
+                            "attributes": [
+                                _attribute("service.name", settings.app_name),
+                                _attribute("service.version", settings.app_version),
+                            ]
+                        },
+                        "scopeSpans": [
+                            {
+                                "scope": {"name": __name__},
+                                "spans": [_encode_span(span) for span in batch],
+                            }
+                        ],
+                    }
+                ]
+            }
+        )
+        if self.exporter == "file":
+            # One unbuffered append per batch, so workers' lines do not interleave.
+            with open(self.file_path, "ab", buffering=0) as file:
+                file.write(payload + b"\n")
+        else:
+            request = urllib.request.Request(
+                self.otlp_endpoint,
+                data=payload,
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            with urllib.request.urlopen(request, timeout=self.interval):
+                pass
+
+
+span_exporter = BatchSpanExporter(
+    exporter=settings.tracing_exporter,
+    file_path=settings.tracing_file_path,
+    otlp_endpoint=settings.tracing_otlp_endpoint,
+    batch_size=settings.tracing_batch_size,
+    queue_size=settings.tracing_queue_size,
+    interval=settings.tracing_export_interval_seconds,
+)